@@ -1,7 +1,19 @@
+import ctypes
 from OpenGL.GL import *
 from matutils import *
 import numpy as np
 from material import Material
+from bufferutils import compact_indices, interleave_attributes
+from shaders import ATTRIBUTE_LOCATIONS
+
+# OpenGL types of the vertex attribute data types
+GL_TYPES = {
+    np.dtype(np.float32): GL_FLOAT,
+    np.dtype(np.float16): GL_HALF_FLOAT,
+    np.dtype(np.uint8): GL_UNSIGNED_BYTE,
+    np.dtype(np.uint16): GL_UNSIGNED_SHORT,
+    np.dtype(np.uint32): GL_UNSIGNED_INT,
+}
 
 
 class BaseModel:
@@ -10,7 +22,8 @@ class BaseModel:
     Based on class from workshops
     """
 
-    def __init__(self, scene, M=poseMatrix(), color=[1., 1., 1.], primitive=GL_TRIANGLES, visible=True):
+    def __init__(self, scene, M=poseMatrix(), color=[1., 1., 1.], primitive=GL_TRIANGLES, visible=True,
+                 interleaved=False):
         """
         Initialise model data
         :param scene: scene to which add the model
@@ -18,6 +31,7 @@ class BaseModel:
         :param color: color of the model
         :param primitive: primitive type (EG. GL_TRIANGLES)
         :param visible: visibility of the model
+        :param interleaved: bool, pack all vertex attributes in one interleaved VBO instead of one VBO each
         """
 
         print('Initialising {}'.format(self.__class__.__name__))
@@ -27,7 +41,8 @@ class BaseModel:
         self.scene = scene
         self.primitive = primitive
         self.color = color
-        self.M = M
+        self.M = np.asarray(M, dtype=np.float32)
+        self.interleaved = interleaved
 
         # define other attributes
         self.vertices = None
@@ -35,7 +50,17 @@ class BaseModel:
         self.normals = None
         self.vertex_colors = None
         self.vbos = {}
+        self.vao = None
+        self.index_buffer = None
+        self.index_count = 0
+        self.index_type = GL_UNSIGNED_INT
+        self.vertex_count = 0
         self.attributes = {}
+        self.usage = GL_STATIC_DRAW
+
+        # (min, max) corners and (center, radius) in model space, computed at bind, None if not known
+        self.bounding_box = None
+        self.bounding_sphere = None
 
         # define default material
         self.material = Material(
@@ -45,17 +70,21 @@ class BaseModel:
             Ns=10.0
         )
 
-    def initialise_vbo(self, name, data):
+    def initialise_vbo(self, name, data, location=None):
         """
         Initalise VBO for specific attribute
         :param name: name of the attribute in GLSL shader
-        :param data: attribute data
+        :param data: attribute data, (N, size) or (N,) for one value per vertex
+        :param location: location of the attribute in the GLSL program, defaults to its location in
+        ATTRIBUTE_LOCATIONS, or the next index
         :return:
         """
         print('Initialising VBO for attribute {}'.format(name))
 
-        # bind the location of the attribute in the GLSL program to the next index
-        self.attributes[name] = len(self.vbos)
+        # locations are bound in the GLSL programs before linking, see Shaders.compile()
+        if location is None:
+            location = ATTRIBUTE_LOCATIONS.get(name, len(self.vbos))
+        self.attributes[name] = location
 
         # if data is empty, then print warning and abort
         if data is None:
@@ -65,94 +94,251 @@ class BaseModel:
 
         # create a buffer object
         self.vbos[name] = glGenBuffers(1)
+        self.scene.resources.register('buffer', self.vbos[name], self, data.nbytes)
         # bind it
         glBindBuffer(GL_ARRAY_BUFFER, self.vbos[name])
 
         # set the data in the buffer as the vertex array
-        glBufferData(GL_ARRAY_BUFFER, data, GL_STATIC_DRAW)
+        glBufferData(GL_ARRAY_BUFFER, data, self.usage)
 
         # enable the attribute
         glEnableVertexAttribArray(self.attributes[name])
 
         # associate the bound buffer tp the corresponding input location in the shader
-        glVertexAttribPointer(index=self.attributes[name], size=data.shape[1], type=GL_FLOAT, normalized=False,
-                              stride=0, pointer=None)
+        glVertexAttribPointer(index=self.attributes[name], size=1 if data.ndim == 1 else data.shape[1],
+                              type=GL_TYPES[data.dtype], normalized=False, stride=0, pointer=None)
 
-    def bind(self):
+    def initialise_interleaved_vbo(self, attributes):
         """
-        Store vertex data in VBO to upload to GPU at render time
+        Initialise one VBO holding all attributes interleaved, so that all attributes of a vertex are next
+        to each other in memory
+        :param attributes: dictionary of attribute name in GLSL shader to attribute data
+        """
+        data, layout, stride = interleave_attributes(attributes)
+        print('Initialising interleaved VBO for attributes {}'.format(', '.join(layout)))
+
+        if len(layout) == 0:
+            print('(W) Warning in {}.initialise_interleaved_vbo(): No attribute data'.format(
+                self.__class__.__name__))
+            return
+
+        self.vbos['interleaved'] = glGenBuffers(1)
+        self.scene.resources.register('buffer', self.vbos['interleaved'], self, data.nbytes)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbos['interleaved'])
+        glBufferData(GL_ARRAY_BUFFER, data, self.usage)
+
+        for name, (size, offset) in layout.items():
+            self.attributes[name] = ATTRIBUTE_LOCATIONS[name]
+            glEnableVertexAttribArray(self.attributes[name])
+            glVertexAttribPointer(index=self.attributes[name], size=size, type=GL_FLOAT, normalized=False,
+                                  stride=stride, pointer=ctypes.c_void_p(offset))
+
+    def initialise_index_buffer(self, indices):
+        """
+        Upload the index array, using 16 bit indices when there are few enough vertices. The number and type of
+        indices are kept for drawing.
+        :param indices: array of vertex indices
+        """
+        indices = compact_indices(indices, self.vertex_count)
+        self.index_count = indices.shape[0]
+        self.index_type = GL_TYPES[indices.dtype]
+
+        self.index_buffer = glGenBuffers(1)
+        self.scene.resources.register('buffer', self.index_buffer, self, indices.nbytes)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices, GL_STATIC_DRAW)
+
+    def update_vbo(self, name, data, first=0):
+        """
+        Overwrite part of the VBO of an attribute in place, keeping the same buffer and VAO
+        :param name: name of the attribute in GLSL shader
+        :param data: new attribute data
+        :param first: index of the first vertex to overwrite
+        """
+        data = np.ascontiguousarray(data)
+        row_bytes = data.itemsize * (1 if data.ndim == 1 else data.shape[1])
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbos[name])
+        glBufferSubData(GL_ARRAY_BUFFER, first * row_bytes, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        # the new positions may be outside of the current bounds
+        if name == 'position':
+            self.update_bounds(data, grow=True)
+
+    def update_bounds(self, vertices, grow=False):
+        """
+        Compute the axis aligned bounding box and the bounding sphere of the model in model space, used by the
+        scene to skip models outside of the view
+        :param vertices: (N, 3) vertex positions
+        :param grow: bool, extend the current bounds to contain the vertices rather than replacing them
+        """
+        vertices = np.asarray(vertices, dtype=np.float32)
+        if vertices.ndim != 2 or vertices.shape[0] == 0:
+            if not grow:
+                self.bounding_box = None
+                self.bounding_sphere = None
+            return
+
+        box_min = vertices.min(axis=0)
+        box_max = vertices.max(axis=0)
+        previous = self.bounding_sphere if grow and self.bounding_box is not None else None
+        if previous is not None:
+            box_min = np.minimum(box_min, self.bounding_box[0])
+            box_max = np.maximum(box_max, self.bounding_box[1])
+
+        center = (box_min + box_max) / 2
+        radius = float(np.sqrt(np.max(np.sum((vertices - center) ** 2, axis=1))))
+        if previous is not None:
+            # the previous sphere contains the vertices seen before
+            radius = max(radius, previous[1] + float(np.linalg.norm(center - previous[0])))
+
+        self.bounding_box = (box_min, box_max)
+        self.bounding_sphere = (center, radius)
+
+        # the scene stacks the bounds of all models
+        self.scene.invalidate_matrices()
+
+    def bounds_padding(self):
         """
+        :return: distance the drawn primitives may reach beyond the vertices, EG. when extruded by a shader
+        """
+        return 0.
 
+    def create_vao(self):
+        """
+        Create the vertex array object of the model and bind it
+        """
         # use a vertex array object to pack all buffers for rendering in the GPU
         self.vao = glGenVertexArrays(1)
+        self.scene.resources.register('vertex array', self.vao, self)
 
         # bind the VAO to retrieve all buffers and rendering context
         glBindVertexArray(self.vao)
 
+    def release(self):
+        """
+        Delete the OpenGL objects of the model. The model can be bound again afterwards.
+        """
+        for vbo in self.vbos.values():
+            glDeleteBuffers(1, [vbo])
+            self.scene.resources.unregister('buffer', vbo)
+        self.vbos = {}
+        self.attributes = {}
+
+        if self.index_buffer is not None:
+            glDeleteBuffers(1, [self.index_buffer])
+            self.scene.resources.unregister('buffer', self.index_buffer)
+            self.index_buffer = None
+
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.scene.resources.unregister('vertex array', self.vao)
+            self.vao = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __del__(self):
+        """
+        Release all OpenGL objects when the model is garbage collected, if it was not released before
+        """
+        # the model may not have been fully initialised
+        if getattr(self, 'vao', None) is None and not getattr(self, 'vbos', None) \
+                and getattr(self, 'index_buffer', None) is None:
+            return
+
+        try:
+            self.release()
+        except Exception:
+            # the OpenGL context may already be gone when the interpreter exits
+            pass
+
+    def release_data(self):
+        """
+        Free the CPU copies of the vertex data once they have been uploaded to the GPU
+        """
+        self.vertices = None
+        self.normals = None
+        self.indices = None
+
+    def bind(self):
+        """
+        Store vertex data in VBO to upload to GPU at render time
+        """
+
+        self.create_vao()
+
         if self.vertices is None:
             print('(W) Warning in {}.bind(): No vertex array!'.format(self.__class__.__name__))
 
+        # keep the vertex count and bounds, the vertex data may be released after upload
+        self.vertex_count = 0 if self.vertices is None else self.vertices.shape[0]
+        if self.vertices is not None:
+            self.update_bounds(self.vertices)
+
         # initialise VBOs and link to shader program attributes
-        self.initialise_vbo('position', self.vertices)
-        self.initialise_vbo('normal', self.normals)
+        if self.interleaved:
+            self.initialise_interleaved_vbo({'position': self.vertices, 'normal': self.normals})
+        else:
+            self.initialise_vbo('position', self.vertices)
+            self.initialise_vbo('normal', self.normals)
 
         # if indices are provided, put them in a buffer too
-        if self.vertices is not None:
-            self.index_buffer = glGenBuffers(1)
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
-            glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices, GL_STATIC_DRAW)
-
-        # bind all attributes to the correct locations in the VAO
-        for name in self.attributes:
-            glBindAttribLocation(self.scene.shaders.program, self.attributes[name], name)
-            print('Binding attribute {} to location {}'.format(name, self.attributes[name]))
+        if self.indices is not None:
+            self.initialise_index_buffer(self.indices)
 
         # unbind the VAO and VBO when done to avoid any side effects
         glBindVertexArray(0)
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
-    def draw(self, Mp, shaders):
+    def draw(self, Mp, shaders, matrices=None):
         """
         Draw the model using OpenGL
         :param Mp: position matrix
         :param shaders: shaders to use
+        :param matrices: (M, PVM, VM, VMiT) of the model precomputed by the scene, None to compute them from Mp
         """
 
         if self.visible:
-            if self.vertices is None:
+            if self.vertex_count == 0:
                 print('(W) Warning in {}.draw(): No vertex array!'.format(self.__class__.__name__))
 
-            # tell openGL to use this shader program for rendering
-            glUseProgram(shaders.program)
-
-            # setup the shader program and give it the model, view and projection matrices to use for rendering
-            shaders.bind(
+            # setup the shader program, the uniforms shared by all models are only set once per frame
+            shaders.bind_frame(
                 P=self.scene.P,
                 V=self.scene.camera.V,
-                M=np.matmul(Mp, self.M),
                 mode=self.scene.mode,
-                material=self.material,
-                light=self.scene.light
+                light=self.scene.light,
+                frame=self.scene.frame
             )
 
+            # give it the model matrix to use for rendering
+            if matrices is None:
+                shaders.bind_model(M=np.matmul(Mp, self.M), material=self.material)
+            else:
+                shaders.bind_model(M=matrices[0], material=self.material, matrices=matrices[1:])
+
             # bind the VAO so that all buffers are bound correctly and the following operations affect them
             glBindVertexArray(self.vao)
 
-            # check whether the data is stored as vertex array or index array
-            if self.indices is not None:
-                # draw the data in buffer using index array
-                glDrawElements(self.primitive, self.indices.flatten().shape[0], GL_UNSIGNED_INT, None)
-            else:
-                # draw the data in buffer using vertex array ordering only
-                glDrawArrays(self.primitive, 0, self.vertices.shape[0])
+            self.draw_primitives()
 
             # unbind the shader to avoid side effects
             glBindVertexArray(0)
 
+    def draw_primitives(self):
+        """
+        Issue the draw call for the data in the bound VAO
+        """
+        # check whether the data is stored as vertex array or index array
+        if self.index_buffer is not None:
+            # draw the data in buffer using index array
+            glDrawElements(self.primitive, self.index_count, self.index_type, None)
+        else:
+            # draw the data in buffer using vertex array ordering only
+            glDrawArrays(self.primitive, 0, self.vertex_count)
 
-def __del__(self):
-    """
-    Release all VBO objects when finished
-    """
-    for vbo in self.vbos.items():
-        glDeleteBuffers(1, vbo)
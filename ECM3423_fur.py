@@ -1,9 +1,30 @@
 from scene import Scene
-from blender import load_obj_file
+from blender import load_obj_files
 from LineModel import *
 from fur import Fur
+from furcache import FurCache
 import numpy as np
 
+# seed of the fur random stream
+FUR_SEED = 3423
+
+# extrude hairs in the fur shader rather than on the CPU
+FUR_GPU_EXTRUSION = False
+
+# number of processes growing the fur
+FUR_WORKERS = 1
+
+# grow the fur progressively between frames, spending at most FUR_FRAME_MS milliseconds per frame
+FUR_STREAMING = False
+FUR_FRAME_MS = 10
+
+# pack the model vertex attributes in one interleaved VBO
+INTERLEAVED_VBO = True
+
+# read the frame and material uniforms from uniform buffer objects (needs OpenGL 3.1)
+USE_UBO_SHADER = False
+
+
 class DrawModelFromMesh(BaseModel):
     """
     Class for model drawn from mesh
@@ -17,25 +38,22 @@ class DrawModelFromMesh(BaseModel):
         :param mesh: mesh to draw model from
         """
 
-        BaseModel.__init__(self, scene=scene, M=M)
+        BaseModel.__init__(self, scene=scene, M=M, interleaved=INTERLEAVED_VBO)
 
         # initialise the vertices of the shape
         self.vertices = mesh.vertices
 
-        # initialise the faces of the shape
-        self.indices = mesh.faces
-
         # check which primitives we need to use for drawing
-        if self.indices.shape[1] == 3:
-            self.primitive = GL_TRIANGLES
-        elif self.indices.shape[1] == 4:
-            self.primitive = GL_QUADS
-        else:
+        if mesh.faces.shape[1] != 3 and mesh.faces.shape[1] != 4:
             print(
                 '(E) Error in DrawModelFromObjFile.__init__(): index array must have 3 (triangles) or 4 (quads) columns, found {}!'.format(
-                    self.indices.shape[1]))
+                    mesh.faces.shape[1]))
             raise
 
+        # initialise the faces of the shape, quads are drawn as two triangles
+        self.indices = mesh.triangles
+        self.primitive = GL_TRIANGLES
+
         # initialise the normals per vertex
         self.normals = mesh.normals
 
@@ -52,7 +70,11 @@ class DrawModelFromMesh(BaseModel):
             self.normals = np.zeros(self.vertices.shape, dtype='f')
 
         # create fur for model and add to scene
-        fur = Fur(scene, self.vertices, self.normals, self.indices)
+        # fixed seed so that the fur cache can be reused between runs
+        # the fur grows on the original faces, quads included
+        fur = Fur(scene, self.vertices, self.normals, mesh.faces, seed=FUR_SEED, cache=FurCache(),
+                  gpu_extrusion=FUR_GPU_EXTRUSION, workers=FUR_WORKERS,
+                  streaming=FUR_STREAMING, frame_ms=FUR_FRAME_MS)
         self.scene.set_fur(fur)
 
         # bind the data to a vertex array
@@ -65,11 +87,15 @@ Main code to run program
 if __name__ == '__main__':
     # initialises the scene
     scene = Scene()
+    if USE_UBO_SHADER:
+        scene.shaders = scene.shaders_list['GouraudUBO']
 
     #
     # MODEL SELECTION
     #
-    meshes = load_obj_file('models/torus.obj')  # change to 'models/torus.obj' for torus model
+    # all files are parsed in parallel, add files to the list to load more models
+    model_files = ['models/torus.obj']  # change to 'models/bunny_world.obj' for bunny model
+    meshes = [mesh for file_meshes in load_obj_files(model_files) for mesh in file_meshes]
 
     # add imported models to scene
     scene.add_models_list(
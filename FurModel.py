@@ -0,0 +1,92 @@
+from OpenGL.GL import *
+from matutils import *
+import numpy as np
+from BaseModel import BaseModel
+from furutils import hair_root_buffers
+
+
+class FurModel(BaseModel):
+    """
+    Fur model extruded on the GPU, child of BaseModel.
+    Only the hair roots are uploaded, each hair is drawn as an instance of a two vertex line whose second vertex
+    is moved along the hair direction by the fur shader.
+    """
+    def __init__(self, scene, vertices, normals, scales, length, M=poseMatrix(), material=None, visible=True):
+        """
+        Initialise the model data
+        :param scene: scene to which model will be added
+        :param vertices: hair roots
+        :param normals: hair normals
+        :param scales: random hair lengths, in tenths of the fur length
+        :param length: approximate hair length
+        :param M: position of model
+        :param material: material of the fur
+        :param visible: model visibility
+        """
+        BaseModel.__init__(self, scene=scene, M=M, primitive=GL_LINES, visible=visible)
+
+        self.vertices = vertices
+        self.normals = normals
+        self.scales = scales
+        self.length = length
+
+        # direction of all hairs, or None to use the hair normals
+        self.direction = None
+
+        # number of hairs drawn, all of them if None
+        self.draw_count = None
+
+        if material is not None:
+            self.material = material
+
+    def bind(self):
+        """
+        Store the hair roots in VBOs, one row per line instance
+        """
+        self.vertex_count = self.vertices.shape[0]
+        self.update_bounds(self.vertices)
+
+        self.create_vao()
+
+        for name, data in hair_root_buffers(self.vertices, self.normals, self.scales).items():
+            self.initialise_vbo(name, data)
+            # advance the attribute once per hair rather than once per vertex
+            glVertexAttribDivisor(self.attributes[name], 1)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def bounds_padding(self):
+        """
+        :return: length of the longest hair, as hairs are extruded from their roots by the shader
+        """
+        if self.scales is None or len(self.scales) == 0:
+            return 0.
+        direction = 1. if self.direction is None else float(np.linalg.norm(self.direction))
+        return float(self.length) * float(np.max(self.scales)) * 0.1 * direction
+
+    def draw(self, Mp, shaders, matrices=None):
+        """
+        Draw the fur using its own shader
+        :param Mp: position matrix
+        :param shaders: shaders used by the other models, ignored
+        :param matrices: (M, PVM, VM, VMiT) of the model precomputed by the scene
+        """
+        shaders = self.scene.shaders_list['Fur']
+
+        # hair length and direction are uniforms, so changing them needs no buffer update
+        shaders.uniforms['fur_length'].set(float(self.length))
+        if self.direction is None:
+            shaders.uniforms['random_angle'].set(0)
+        else:
+            shaders.uniforms['random_angle'].set(1)
+            shaders.uniforms['fur_direction'].set(np.asarray(self.direction, 'f'))
+
+        BaseModel.draw(self, Mp, shaders, matrices)
+
+    def draw_primitives(self):
+        """
+        Draw one line instance per hair
+        """
+        count = self.vertex_count if self.draw_count is None else self.draw_count
+        glDrawArraysInstanced(self.primitive, 0, 2, count)
@@ -9,7 +9,8 @@ class LineModel(BaseModel):
     """
     Basic class for creating line models, child of BaseModel
     """
-    def __init__(self, scene, vertices, normals, M=poseMatrix(), material=None, primitive=GL_LINES, visible=True):
+    def __init__(self, scene, vertices, normals, M=poseMatrix(), material=None, primitive=GL_LINES, visible=True,
+                 indices=None):
         """
         Initialise the model data
         :param scene: scene to which model will be added
@@ -18,22 +19,20 @@ class LineModel(BaseModel):
         :param M: position of model
         :param primitive: line primitive type (EG. GL_LINES, GL_LINE_STRIP)
         :param visible: model visibility
+        :param indices: optional index array, EG. pairs of vertices for GL_LINES
         """
 
+        BaseModel.__init__(self, scene, M=M, primitive=primitive, visible=visible)
+
         # assign constructor arguments to object attributes
-        self.visible = visible
         self.vertices = vertices
-        self.scene = scene
-        self.primitive = primitive
-        self.M = M
-        self.material = material
         self.normals = normals
+        self.indices = indices
+        self.material = material
 
-        # define other attributes
-        self.indices = None
-        self.vertex_colors = None  # not needed for lines
-        self.vbos = {}
-        self.attributes = {}
+        # define the attributes that differ for lines
+        self.usage = GL_DYNAMIC_DRAW  # line vertices are updated in place
+        self.draw_count = None  # number of indices (or vertices) drawn, all of them if None
 
         if self.material is None:
             # default material if none given
@@ -44,10 +43,14 @@ class LineModel(BaseModel):
                 Ns=10.0
             )
 
+    def draw_primitives(self):
+        """
+        Issue the draw call, only drawing the first draw_count indices (or vertices) if it is set
+        """
+        if self.draw_count is None:
+            BaseModel.draw_primitives(self)
+        elif self.index_buffer is not None:
+            glDrawElements(self.primitive, self.draw_count, self.index_type, None)
+        else:
+            glDrawArrays(self.primitive, 0, self.draw_count)
 
-def __del__(self):
-    """
-    Release all VBO objects when finished.
-    """
-    for vbo in self.vbos.items():
-        glDeleteBuffers(1, vbo)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Benchmark of the bulk OBJ parser against the line by line parser.
+Usage: python benchmark_obj.py [file.obj ...] [--grid N]
+--grid N also benchmarks a generated N x N grid of quads (N * N faces, so N = 1000 is a million faces).
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from blender import create_meshes_from_blender, read_obj_file, read_obj_file_by_line
+
+
+def write_grid_obj(file_name, n):
+    """
+    Write a flat n x n grid of quads to an obj file
+    :param file_name: path of the obj file
+    :param n: number of quads along each side
+    """
+    x, z = np.meshgrid(np.arange(n + 1, dtype='f'), np.arange(n + 1, dtype='f'))
+    vertices = np.stack([x.ravel(), np.zeros(x.size, 'f'), z.ravel()], axis=1)
+
+    corner = (np.arange(n)[:, None] * (n + 1) + np.arange(n)[None, :]).ravel() + 1
+    faces = np.stack([corner, corner + n + 1, corner + n + 2, corner + 1], axis=1)
+
+    with open(file_name, 'w') as objfile:
+        # the material library is missing on purpose, so the default material is used
+        objfile.write('mtllib grid.mtl\no Grid\nusemtl default\n')
+        np.savetxt(objfile, vertices, fmt='v %.4f %.4f %.4f')
+        np.savetxt(objfile, faces, fmt='f %d %d %d %d')
+
+
+def time_reader(reader, file_name):
+    """
+    Read a file, silencing the reader output. Only reading is timed, the meshes are then created the same way
+    for both readers.
+    :param reader: function reading the records of an obj file
+    :param file_name: path to the obj file
+    :return: (seconds, meshes)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        records = reader(file_name)
+        end = time.perf_counter()
+        meshes = create_meshes_from_blender(*records)
+    return end - start, meshes
+
+
+def same_meshes(meshes_a, meshes_b):
+    """
+    Compare the geometry and materials of two lists of meshes
+    """
+    if len(meshes_a) != len(meshes_b):
+        return False
+    for a, b in zip(meshes_a, meshes_b):
+        if not (np.array_equal(a.vertices, b.vertices) and np.array_equal(a.faces, b.faces)
+                and np.array_equal(a.normals, b.normals, equal_nan=True) and a.material.name == b.material.name):
+            return False
+    return True
+
+
+def benchmark(file_name):
+    """
+    Time both parsers on a file and check that they give the same meshes
+    :param file_name: path to the obj file
+    """
+    by_line, meshes_by_line = time_reader(read_obj_file_by_line, file_name)
+    bulk, meshes_bulk = time_reader(read_obj_file, file_name)
+    print('{}: line by line {:.3f}s, bulk {:.3f}s, speedup x{:.1f}, same meshes: {}'.format(
+        file_name, by_line, bulk, by_line / bulk, same_meshes(meshes_by_line, meshes_bulk)))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    files = []
+    grid = None
+    while args:
+        arg = args.pop(0)
+        if arg == '--grid':
+            grid = int(args.pop(0))
+        else:
+            files.append(arg)
+
+    if not files and grid is None:
+        files = ['models/torus.obj']
+
+    for file_name in files:
+        benchmark(file_name)
+
+    if grid is not None:
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'grid_{}.obj'.format(grid))
+            write_grid_obj(file_name, grid)
+            benchmark(file_name)
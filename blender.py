@@ -1,6 +1,13 @@
+import os
+import re
+import warnings
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
 from material import Material, MaterialLibrary
 from mesh import Mesh
+from meshcache import load_mesh_cache, save_mesh_cache
+from sharedarrays import SharedArrays
 
 """
 Functions for reading models from blender (modified). 
@@ -33,9 +40,17 @@ def process_line(line):
 
     elif fields[0] == 'vt':
         label = 'vertex texture'
-        if len(fields) != 3:
+        if len(fields) != 3 and len(fields) != 4:
             print('(E) Error, 2 entries expected for vertex texture')
             return None
+        # only keep (u, v)
+        return (label, [float(token) for token in fields[1:3]])
+
+    elif fields[0] == 'vn':
+        label = 'normal'
+        if len(fields) != 4:
+            print('(E) Error, 3 entries expected for vertex normal')
+            return None
 
     elif fields[0] == 'mtllib':
         label = 'material library'
@@ -59,11 +74,8 @@ def process_line(line):
             print('(E) Error, 3 or 4 entries expected for faces\n{}'.format(line))
             return None
 
-        # support different formats
-        try:
-            return (label, [[np.uint32(i) for i in v.split('/')] for v in fields[1:]])
-        except:
-            return (label, [[np.uint32(i) for i in v.split('//')] for v in fields[1:]])
+        # support different formats, each corner becomes (v, vt, vn) with 0 for a missing index
+        return (label, [[np.uint32(i) if i != '' else 0 for i in (v.split('/') + ['', ''])[:3]] for v in fields[1:]])
 
     else:
         print('(E) Unknown line: {}'.format(fields))
@@ -78,7 +90,7 @@ def load_material_library(file_name):
     :param file_name: path to the mtl file
     :return: material library
     """
-    library = MaterialLibrary()
+    library = MaterialLibrary(file_name)
     material = None
 
     print('-- Loading material library {}'.format(file_name))
@@ -94,12 +106,13 @@ def load_material_library(file_name):
 
                 material = Material(fields[1])
                 print('Found material definition: {}'.format(material.name))
+            # only read the values, some files have comments after them
             elif fields[0] == 'Ka':
-                material.Ka = np.array(fields[1:], 'f')
+                material.Ka = np.array(fields[1:4], 'f')
             elif fields[0] == 'Kd':
-                material.Kd = np.array(fields[1:], 'f')
+                material.Kd = np.array(fields[1:4], 'f')
             elif fields[0] == 'Ks':
-                material.Ks = np.array(fields[1:], 'f')
+                material.Ks = np.array(fields[1:4], 'f')
             elif fields[0] == 'Ns':
                 material.Ns = float(fields[1])
             elif fields[0] == 'd':
@@ -118,17 +131,56 @@ def load_material_library(file_name):
     return library
 
 
-def load_obj_file(file_name):
+# material libraries already loaded, by absolute path, so that libraries shared by several obj files are only
+# parsed once
+material_libraries = {}
+
+
+def get_material_library(obj_file_name, library_name):
     """
-    Function for loading a Blender3D object file
+    Get the material library used by an obj file, loading it only the first time it is used
+    :param obj_file_name: path to the obj file
+    :param library_name: name of the mtl file in the obj file, relative to the obj file folder
+    :return: material library
+    """
+    file_name = os.path.join(os.path.dirname(obj_file_name), library_name)
+    key = os.path.abspath(file_name)
+
+    if key not in material_libraries:
+        try:
+            material_libraries[key] = load_material_library(file_name)
+        except FileNotFoundError:
+            # if material file not found, add a material library with default material
+            library = MaterialLibrary()
+            library.add_material(Material('default'))
+            print('(W) Material library file {} not found, using default.'.format(library_name))
+            material_libraries[key] = library
+
+    return material_libraries[key]
+
+
+def load_obj_file_by_line(file_name):
+    """
+    Function for loading a Blender3D object file, processing it line by line.
+    Slower than load_obj_file(), but accepts mixed face formats.
     :param file_name: path to the obj file
     :return: mesh
     """
+    return create_meshes_from_blender(*read_obj_file_by_line(file_name))
+
+
+def read_obj_file_by_line(file_name):
+    """
+    Read the records of a Blender3D object file, line by line
+    :param file_name: path to the obj file
+    :return: vertex list, face list, material list, material library, texture coordinates list, normal list
+    """
 
     print('Loading mesh(es) from Blender file: {}'.format(file_name))
 
     vlist = []
     tlist = []
+    nlist = []
     flist = []
     mlist = []
 
@@ -140,6 +192,7 @@ def load_obj_file(file_name):
 
     # current material object
     material = None
+    library = None
 
     with open(file_name) as objfile:
         line_nb = 0  # count line number for easier error locating
@@ -159,7 +212,7 @@ def load_obj_file(file_name):
                 vlist.append(data[1])
 
             elif data[0] == 'normal':
-                vlist.append(data[1])
+                nlist.append(data[1])
 
             elif data[0] == 'vertex texture':
                 tlist.append(data[1])
@@ -169,76 +222,475 @@ def load_obj_file(file_name):
                 mlist.append(material)
 
             elif data[0] == 'material library':
-                try:
-                    library = load_material_library('models/{}'.format(data[1]))
-                except FileNotFoundError:
-                    # if material file not found, add a material library with default material
-                    library = MaterialLibrary()
-                    library.add_material(Material('default'))
-                    print('(W) Material library file {} not found, using default.'.format(data[1]))
+                library = get_material_library(file_name, data[1])
 
             # material indicate a new mesh in the file, so we store the previous one if not empty and start
             # a new one.
             elif data[0] == 'material':
-                try:
+                if library is not None and data[1] in library.names:
                     material = library.names[data[1]]
                     print('[l.{}] Loading mesh with material: {}'.format(line_nb, data[1]))
-                except KeyError:
-                    material = library.names['default']
+                else:
+                    material = None if library is None else library.names.get('default')
                     print('[l.{}] Loading mesh with default material.'.format(line_nb))
 
 
     print('File read. Found {} vertices and {} faces.'.format(len(vlist), len(flist)))
-    return create_meshes_from_blender(vlist, flist, mlist, library)
+    return vlist, flist, mlist, library, tlist, nlist
+
+
+# records of an obj file, one per line. Matching the newline before the record rather than using ^ in
+# multiline mode lets the regex engine jump between newlines, which is several times faster.
+VERTEX_RE = re.compile(r'\nv[ \t]+([^\n]*)')
+TEXTURE_RE = re.compile(r'\nvt[ \t]+([^\n]*)')
+NORMAL_RE = re.compile(r'\nvn[ \t]+([^\n]*)')
+FACE_RE = re.compile(r'\nf[ \t]+([^\n]*)')
+MATERIAL_LIBRARY_RE = re.compile(r'\nmtllib[ \t]+(\S+)')
+# usemtl lines split the file into runs of faces sharing a material
+MATERIAL_SPLIT_RE = re.compile(r'\nusemtl[ \t]+(\S+)[^\n]*')
+
+
+def parse_numbers(text, rows, columns, dtype):
+    """
+    Convert numbers separated by spaces into an array, in one call
+    :param text: string of all the numbers
+    :param rows: number of records in the text
+    :param columns: number of values expected per record
+    :param dtype: type of the values
+    :return: (rows, columns) array, or None if the text does not hold rows * columns numbers
+    """
+    if rows == 0:
+        return np.zeros((0, columns), dtype=dtype)
+
+    try:
+        with warnings.catch_warnings():
+            # numpy only warns when it stops reading at a value it cannot parse
+            warnings.simplefilter('error', DeprecationWarning)
+            values = np.fromstring(text, dtype=dtype, sep=' ')
+    except (ValueError, DeprecationWarning):
+        return None
+
+    if values.shape[0] != rows * columns:
+        return None
+
+    return values.reshape(rows, columns)
+
+
+def parse_faces(records):
+    """
+    Convert face records into an array of vertex indices, in one call
+    :param records: list of face strings, EG. '1/1/1 2/2/2 3/3/3'
+    :return: (F, corners, 3) uint32 array of (v, vt, vn) indices with 0 for a missing index, or None if faces
+    do not all use the same format
+    """
+    if len(records) == 0:
+        return np.zeros((0, 3, 3), dtype=np.uint32)
+
+    # number of corners and format of the corners of the first face, all faces must match it
+    tokens = records[0].split()
+    corners = len(tokens)
+    present = [entry != '' for entry in (tokens[0].split('/') + ['', ''])[:3]]
+    if corners != 3 and corners != 4:
+        print('(E) Error, 3 or 4 entries expected for faces\n{}'.format(records[0]))
+        return None
+
+    # 'v/vt/vn', 'v//vn', and 'v/vt' all become numbers separated by spaces
+    text = ' '.join(records).replace('//', ' ').replace('/', ' ')
+    values = parse_numbers(text, len(records), corners * sum(present), np.int64)
+    if values is None:
+        return None
+
+    faces = np.zeros((len(records), corners, 3), dtype=np.uint32)
+    faces[:, :, present] = values.reshape(len(records), corners, sum(present))
+    return faces
+
+
+def load_obj_file(file_name, cache=True, progress=None):
+    """
+    Function for loading a Blender3D object file
+    :param file_name: path to the obj file
+    :param cache: bool, load the meshes from the binary mesh cache next to the file if it is up to date,
+    and write it otherwise
+    :param progress: function called while parsing with (file name, characters read, file size in bytes)
+    :return: mesh
+    """
+    return load_obj_files([file_name], workers=1, cache=cache, progress=progress)[0]
+
+
+def load_obj_files(file_names, workers=None, cache=True, progress=None):
+    """
+    Load several Blender3D object files, building their meshes in parallel in a process pool. Mesh arrays are
+    returned through shared memory, and material libraries are shared by the files using the same one.
+    :param file_names: list of paths to obj files
+    :param workers: number of worker processes, defaults to one per file up to the number of CPUs. With 1, files
+    are loaded in this process.
+    :param cache: bool, use the binary mesh cache next to each file
+    :param progress: function called while parsing with (file name, characters read, file size in bytes). It is
+    called in the worker processes, so it must be a module level function when workers > 1.
+    :return: list of the meshes of each file, in the order of file_names
+    """
+    meshes = [load_mesh_cache(file_name) if cache else None for file_name in file_names]
+    load_names = [file_name for file_name, file_meshes in zip(file_names, meshes) if file_meshes is None]
+
+    if workers is None:
+        workers = min(len(load_names), os.cpu_count() or 1)
+
+    if workers > 1 and len(load_names) > 1:
+        # the workers create the shared memory freed here, start the tracker first so they all share this one
+        resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_obj_meshes_shared, file_name, cache, progress) for file_name in load_names]
+            # collect the results while the workers are alive, as they created the shared memory
+            loaded = [receive_obj_meshes(*future.result()) for future in futures]
+    else:
+        loaded = [build_obj_meshes(file_name, cache, progress)[0] for file_name in load_names]
+    loaded = dict(zip(load_names, loaded))
+
+    return [loaded[file_name] if file_meshes is None else file_meshes
+            for file_name, file_meshes in zip(file_names, meshes)]
+
 
+# arrays of a mesh returned by the worker processes
+MESH_ARRAYS = ('vertices', 'normals', 'faces', 'texture_coords')
 
-def create_meshes_from_blender(vlist, flist, mlist, library):
+
+def build_obj_meshes(file_name, cache=True, progress=None):
+    """
+    Parse an obj file, build its meshes and write its mesh cache
+    :param file_name: path to the obj file
+    :param cache: bool, write the binary mesh cache next to the file
+    :param progress: function called while parsing with (file name, characters read, file size in bytes)
+    :return: (meshes, material library or None)
+    """
+    records = resolve_obj_records(file_name, parse_obj_file(file_name, progress=progress))
+    meshes = create_meshes_from_blender(*records)
+    library = records[3]
+
+    if cache:
+        sources = [file_name]
+        if library is not None and library.file_name is not None:
+            sources.append(library.file_name)
+        save_mesh_cache(file_name, meshes, sources)
+
+    return meshes, library
+
+
+def build_obj_meshes_shared(file_name, cache=True, progress=None):
+    """
+    Build the meshes of an obj file in a worker process, see build_obj_meshes(). The mesh arrays are written to
+    shared memory rather than pickled, receive_obj_meshes() copies them out and frees the memory.
+    :param file_name: path to the obj file
+    :param cache: bool, write the binary mesh cache next to the file
+    :param progress: function called while parsing with (file name, characters read, file size in bytes)
+    :return: (library key, material library or None, list of (index of the material in the library or -1 for
+    the default material, SharedArrays.specs of the mesh arrays) for every mesh)
+    """
+    meshes, library = build_obj_meshes(file_name, cache, progress)
+
+    key = None
+    material_ids = {}
+    if library is not None:
+        key = next(name for name, value in material_libraries.items() if value is library)
+        material_ids = {id(material): index for index, material in enumerate(library.materials)}
+
+    entries = []
+    for mesh in meshes:
+        arrays = {name: getattr(mesh, name) for name in MESH_ARRAYS if getattr(mesh, name) is not None}
+        shared = SharedArrays({name: (array.shape, array.dtype) for name, array in arrays.items()})
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        entries.append((material_ids.get(id(mesh.material), -1), shared.specs))
+        # the memory stays allocated for the parent process
+        shared.close()
+
+    return key, library, entries
+
+
+def receive_obj_meshes(key, library, entries):
+    """
+    Create the meshes built by a worker process, and free their shared memory
+    :param key: key of the material library in material_libraries, or None if the file has none
+    :param library: material library loaded by the worker, only used if this process has not loaded it yet
+    :param entries: list of (material index, SharedArrays.specs) of every mesh
+    :return: list of meshes
+    """
+    if key is not None:
+        library = material_libraries.setdefault(key, library)
+
+    meshes = []
+    for material, specs in entries:
+        shared = SharedArrays.attach(specs)
+        arrays = {name: np.array(array) for name, array in shared.arrays.items()}
+        shared.close(unlink=True)
+
+        meshes.append(Mesh(material=library.materials[material] if material >= 0 else Material('default'),
+                           **arrays))
+
+    return meshes
+
+
+def read_obj_file(file_name):
+    """
+    Read the records of a Blender3D object file. The whole file is read at once and every type of record
+    is converted in bulk, falling back to read_obj_file_by_line() if records do not all use the same format.
+    :param file_name: path to the obj file
+    :return: vertex array, face array, material list, material library, texture coordinates array, normal array
     """
-    create meshes from an obj file
+    return resolve_obj_records(file_name, parse_obj_file(file_name))
+
+
+def resolve_obj_records(file_name, parsed):
+    """
+    Resolve the materials of a parsed obj file
+    :param file_name: path to the obj file
+    :param parsed: output of parse_obj_file()
+    :return: vertex array, face array, material list, material library, texture coordinates array, normal array
+    """
+    if parsed is None:
+        print('(W) Records of {} do not all use the same format, loading it line by line.'.format(file_name))
+        return read_obj_file_by_line(file_name)
+
+    varray, farray, tarray, narray, library_name, run_materials, run_lengths = parsed
+
+    library = None
+    if library_name is not None:
+        library = get_material_library(file_name, library_name)
+
+    # the first run has no material, then every usemtl line starts a new run. -1 stands for no material.
+    run_ids = []
+    material = -1
+    for name in run_materials:
+        if name is not None:
+            if library is not None and name in library.names:
+                material = library.names[name]
+                print('Loading mesh with material: {}'.format(name))
+            else:
+                material = -1 if library is None else library.names.get('default', -1)
+                print('Loading mesh with default material.')
+        run_ids.append(material)
+    mlist = np.repeat(np.array(run_ids, dtype=np.int64), run_lengths)
+
+    return varray, farray, mlist, library, tarray, narray
+
+
+class GrowableArray:
+    """
+    Array that rows can be appended to, growing its storage geometrically so that appending is amortised
+    constant time and the storage is never more than twice the data
+    """
+    def __init__(self, row_shape, dtype, capacity=1024):
+        """
+        Initialise the array
+        :param row_shape: shape of each row, EG. (3,) for vertices
+        :param dtype: type of the values
+        :param capacity: number of rows allocated at first
+        """
+        self.data = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self.size = 0
+
+    def append(self, rows):
+        """
+        Append rows at the end of the array
+        :param rows: array of rows, with the same row shape as the array
+        """
+        if rows.shape[1:] != self.data.shape[1:]:
+            raise ValueError('rows of shape {} do not match array rows of shape {}'.format(
+                rows.shape[1:], self.data.shape[1:]))
+
+        if self.size + rows.shape[0] > self.data.shape[0]:
+            data = np.empty((max(2 * self.data.shape[0], self.size + rows.shape[0]),) + self.data.shape[1:],
+                            dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+        self.data[self.size:self.size + rows.shape[0]] = rows
+        self.size += rows.shape[0]
+
+    def array(self):
+        """
+        Shrink the storage to the rows appended so far, in place
+        :return: the rows appended so far
+        """
+        # the storage is only referenced by this object, so it can be reallocated without copying it first
+        self.data.resize((self.size,) + self.data.shape[1:], refcheck=False)
+        return self.data
+
+
+# size of the chunks of text parsed at once when reading an obj file
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def parse_obj_file(file_name, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Parse the geometry of a Blender3D object file, without loading its materials so that it can run in a worker
+    process. The file is read in chunks whose records are converted in bulk and appended to growable arrays,
+    so memory use stays close to the size of the output arrays.
+    :param file_name: path to the obj file
+    :param chunk_size: number of characters read at once
+    :param progress: function called after each chunk with (file name, characters read, file size in bytes)
+    :return: vertex array, face array, texture coordinates array, normal array, material library name,
+    material name of each run of faces, number of faces of each run; or None if records do not all use the
+    same format
+    """
+
+    print('Loading mesh(es) from Blender file: {}'.format(file_name))
+
+    file_size = os.path.getsize(file_name)
+    library_name = None
+
+    vertices = GrowableArray((3,), np.float32)
+    texture_coords = GrowableArray((2,), np.float32)
+    normals = GrowableArray((3,), np.float32)
+    faces = None
+
+    # the first run has no material, then every usemtl line starts a new run
+    run_materials = [None]
+    run_lengths = [0]
+
+    read = 0
+    rest = ''
+    with open(file_name) as objfile:
+        while True:
+            chunk = objfile.read(chunk_size)
+            read += len(chunk)
+
+            # only parse complete lines, the last one is kept for the next chunk. The leading newline lets the
+            # first line match the record patterns.
+            if chunk:
+                end = chunk.rfind('\n') + 1
+                text = '\n' + rest + chunk[:end]
+                rest = chunk[end:] if end > 0 else rest + chunk
+                if end == 0:
+                    continue
+            else:
+                text = '\n' + rest
+
+            if library_name is None:
+                match = MATERIAL_LIBRARY_RE.search(text)
+                library_name = None if match is None else match.group(1)
+
+            runs = MATERIAL_SPLIT_RE.split(text)
+            flist = []
+            for run in range(0, len(runs), 2):
+                run_faces = FACE_RE.findall(runs[run])
+                flist += run_faces
+                if run > 0:
+                    run_materials.append(runs[run - 1])
+                    run_lengths.append(0)
+                run_lengths[-1] += len(run_faces)
+
+            # vertex data does not depend on the material, read it from the whole chunk
+            vlist = VERTEX_RE.findall(text)
+            tlist = TEXTURE_RE.findall(text)
+            nlist = NORMAL_RE.findall(text)
+
+            varray = parse_numbers(' '.join(vlist), len(vlist), 3, np.float32)
+            narray = parse_numbers(' '.join(nlist), len(nlist), 3, np.float32)
+            # texture coordinates may have an optional third value, only keep (u, v)
+            tarray = parse_numbers(' '.join(tlist), len(tlist), len(tlist[0].split()) if tlist else 2, np.float32)
+            farray = parse_faces(flist)
+            if varray is None or narray is None or tarray is None or farray is None:
+                return None
+
+            try:
+                vertices.append(varray)
+                texture_coords.append(tarray[:, :2])
+                normals.append(narray)
+                if len(flist) > 0:
+                    if faces is None:
+                        faces = GrowableArray(farray.shape[1:], np.uint32)
+                    faces.append(farray)
+            except ValueError:
+                # faces with a different number of corners than in previous chunks, left to the line by line
+                # reader which splits them into triangles
+                return None
+
+            if progress is not None and chunk:
+                progress(file_name, read, file_size)
+
+            if not chunk:
+                break
+
+    farray = np.zeros((0, 3, 3), dtype=np.uint32) if faces is None else faces.array()
+    print('File read. Found {} vertices and {} faces.'.format(vertices.size, farray.shape[0]))
+    return vertices.array(), farray, texture_coords.array(), normals.array(), library_name, run_materials, \
+        run_lengths
+
+
+def create_mesh(corners, varray, tarray, narray, material):
+    """
+    Create a mesh from face corners, with one vertex per unique (v, vt, vn) corner so that vertices are only
+    duplicated where their texture coordinates or normals differ
+    :param corners: (F, 3 or 4, 3) array of (v, vt, vn) indices, starting at 1 with 0 for a missing index
+    :param varray: vertex array
+    :param tarray: texture coordinates array
+    :param narray: normal array
+    :param material: mesh material
+    :return: Mesh
+    """
+    keys = corners.reshape(-1, 3).astype(np.int64)
+
+    try:
+        # pack each corner into one integer, which is much faster to sort than rows
+        packed = np.ravel_multi_index(keys.T, (varray.shape[0] + 1, tarray.shape[0] + 1, narray.shape[0] + 1))
+        packed, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        unique = keys[first]
+    except ValueError:
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+    # only use texture coordinates and normals if all corners have them
+    texture_coords = tarray[unique[:, 1] - 1] if np.all(unique[:, 1] > 0) else None
+    normals = narray[unique[:, 2] - 1] if np.all(unique[:, 2] > 0) else None
+
+    return Mesh(
+        vertices=varray[unique[:, 0] - 1],
+        faces=inverse.reshape(corners.shape[:2]).astype(np.uint32),
+        normals=normals,
+        texture_coords=texture_coords,
+        material=material
+    )
+
+
+def create_meshes_from_blender(vlist, flist, mlist, library, tlist=None, nlist=None):
+    """
+    create meshes from an obj file, one per material
     :param vlist: vertex list
-    :param flist: face list
-    :param mlist: material list
+    :param flist: face list, each corner being (v, vt, vn)
+    :param mlist: material list, or array with -1 for no material
     :param library: material library
+    :param tlist: texture coordinates list
+    :param nlist: normal list
     :return: imported meshes
     """
-    fstart = 0
-    material = None
     meshes = []
 
-    # we start by putting all vertices in one array
-    varray = np.array(vlist, dtype='f')
-
-    for f in range(len(flist)):
-        if material is None:
-            material = mlist[f]
-
-        elif material != mlist[f]:  # new mesh is denoted by change in material
-            farray = np.array(flist[fstart:f], dtype=np.uint32)[:, :, 0]
-            vmax = np.max(farray.flatten())
-            vmin = np.min(farray.flatten()) - 1
-
-            meshes.append(
-                Mesh(
-                    vertices=varray[vmin:vmax, :],
-                    faces=farray - vmin - 1,
-                    material=library.materials[material]
-                )
-            )
-
-            # start the next mesh
-            fstart = f
-
-    farray = np.array(flist[fstart:], dtype=np.uint32)[:, :, 0]
-    vmax = np.max(farray.flatten())
-    vmin = np.min(farray.flatten()) - 1
-
-    meshes.append(
-        Mesh(
-            vertices=varray[vmin:vmax, :],
-            faces=farray - vmin - 1,
-            material=library.materials[material]
+    # triangles and quads cannot be stored in one array, so faces of files mixing them are split into triangles
+    if not isinstance(flist, np.ndarray) and len(set(len(face) for face in flist)) > 1:
+        print('(W) Faces with different numbers of corners, splitting them into triangles.')
+        mlist = [material for face, material in zip(flist, mlist) for corner in range(len(face) - 2)]
+        flist = [[face[0], face[corner], face[corner + 1]] for face in flist for corner in range(1, len(face) - 1)]
+
+    # we start by putting all vertices and faces in arrays
+    varray = np.array(vlist, dtype='f').reshape(-1, 3)
+    tarray = np.array(tlist if tlist is not None else [], dtype='f').reshape(-1, 2)
+    narray = np.array(nlist if nlist is not None else [], dtype='f').reshape(-1, 3)
+    farray = np.asarray(flist, dtype=np.uint32)
+
+    # group the faces by material in one pass, faces before any usemtl line get -1. The sort is stable so faces
+    # keep their order within each mesh.
+    if isinstance(mlist, np.ndarray):
+        materials = mlist
+    else:
+        materials = np.array([-1 if material is None else material for material in mlist], dtype=np.int64)
+    order = np.argsort(materials, kind='stable')
+    material_ids, starts = np.unique(materials[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    for material, start, end in zip(material_ids, starts, ends):
+        meshes.append(
+            create_mesh(farray[order[start:end]], varray, tarray, narray,
+                        library.materials[material] if material >= 0 else Material('default'))
         )
-    )
 
     print('--- Created {} mesh(es) from Blender file.'.format(len(meshes)))
     return meshes
@@ -0,0 +1,124 @@
+"""
+CPU side packing of vertex data into OpenGL buffers, kept free of OpenGL calls so that it can be tested
+without a context
+"""
+
+import numpy as np
+
+
+def interleave_attributes(attributes, dtype=np.float32):
+    """
+    Pack vertex attributes into one interleaved buffer, each row holding all the attributes of one vertex
+    :param attributes: dictionary of attribute name to (N, size) or (N,) array, all with the same N. Attributes
+    whose data is None are skipped.
+    :param dtype: type of the values in the buffer
+    :return: (buffer, layout, stride): (N, total size) array, dictionary of attribute name to (size, offset in
+    bytes), and size of a row in bytes
+    """
+    columns = []
+    layout = {}
+    offset = 0
+    vertex_count = None
+
+    for name, data in attributes.items():
+        if data is None:
+            continue
+
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, None]
+
+        if vertex_count is None:
+            vertex_count = data.shape[0]
+        elif data.shape[0] != vertex_count:
+            raise ValueError('attribute {} has {} vertices, expected {}'.format(name, data.shape[0], vertex_count))
+
+        layout[name] = (data.shape[1], offset)
+        offset += data.shape[1] * np.dtype(dtype).itemsize
+        columns.append(data)
+
+    if vertex_count is None:
+        return np.zeros((0, 0), dtype=dtype), layout, 0
+
+    buffer = np.empty((vertex_count, offset // np.dtype(dtype).itemsize), dtype=dtype)
+    column = 0
+    for data in columns:
+        buffer[:, column:column + data.shape[1]] = data
+        column += data.shape[1]
+
+    return buffer, layout, offset
+
+
+def compact_indices(indices, vertex_count):
+    """
+    Flatten an index array into the smallest unsigned type able to index all vertices
+    :param indices: array of vertex indices, any shape
+    :param vertex_count: number of vertices indexed
+    :return: contiguous 1-D uint16 array if vertex_count allows it, uint32 array otherwise
+    """
+    dtype = np.uint16 if vertex_count <= np.iinfo(np.uint16).max + 1 else np.uint32
+    return np.ascontiguousarray(np.asarray(indices).ravel(), dtype=dtype)
+
+
+# (base alignment, size) in bytes of GLSL types in a std140 uniform block, matrices are stored as arrays of
+# columns each padded to a vec4
+STD140_TYPES = {
+    'float': (4, 4),
+    'int': (4, 4),
+    'vec2': (8, 8),
+    'vec3': (16, 12),
+    'vec4': (16, 16),
+    'mat3': (16, 48),
+    'mat4': (16, 64),
+}
+
+
+# members of the uniform blocks of the UBO shaders, in the order they are declared in GLSL
+FRAME_BLOCK = [('P', 'mat4'), ('V', 'mat4'), ('light', 'vec3'), ('Ia', 'vec3'), ('Id', 'vec3'), ('Is', 'vec3')]
+MATERIAL_BLOCK = [('Ka', 'vec3'), ('Kd', 'vec3'), ('Ks', 'vec3'), ('Ns', 'float')]
+
+
+def std140_layout(fields):
+    """
+    Compute the std140 layout of a uniform block
+    :param fields: list of (name, GLSL type) of the block members, in declaration order
+    :return: (offsets, size): dictionary of member name to offset in bytes, and size of the block in bytes
+    """
+    offsets = {}
+    offset = 0
+    for name, glsl_type in fields:
+        alignment, size = STD140_TYPES[glsl_type]
+        offset = -(-offset // alignment) * alignment
+        offsets[name] = offset
+        offset += size
+
+    # the size of a block is rounded up to the alignment of a vec4
+    return offsets, -(-offset // 16) * 16
+
+
+def std140_pack(fields, values):
+    """
+    Pack values into a std140 uniform block
+    :param fields: list of (name, GLSL type) of the block members, in declaration order
+    :param values: dictionary of member name to value. Matrices are given in row-major order like the other
+    matrices of this code, they are stored column by column as GLSL expects.
+    :return: uint8 array of the block data
+    """
+    offsets, size = std140_layout(fields)
+    data = np.zeros(size, dtype=np.uint8)
+
+    for name, glsl_type in fields:
+        if glsl_type == 'int':
+            member = np.array([values[name]], dtype=np.int32)
+        elif glsl_type in ('mat3', 'mat4'):
+            columns = np.asarray(values[name], dtype=np.float32).T
+            # each column is padded to four floats
+            member = np.zeros((columns.shape[0], 4), dtype=np.float32)
+            member[:, :columns.shape[1]] = columns
+        else:
+            member = np.asarray(values[name], dtype=np.float32).ravel()
+
+        member = member.view(np.uint8).ravel()
+        data[offsets[name]:offsets[name] + member.shape[0]] = member
+
+    return data
@@ -15,18 +15,31 @@ class Camera:
         :param size: window size
         """
         self.size = size
-        self.V = np.identity(4)
+        self.V = np.identity(4, dtype='f')
         self.V[2, 3] = -5.0  # translate the camera five units back, looking at the origin
         self.phi = 0.
         self.psi = 0.
         self.distance = 5.
         self.center = [0., 0., 0.]
 
+        # parameters V was computed from, and number of times V changed so that users can cache what depends on it
+        self.key = None
+        self.version = 0
+
     def update(self):
         """
-        Update the camera
+        Update the camera, V is only recomputed when the camera moved
+        :return: True if V changed
         """
+        key = (tuple(self.center), self.phi, self.psi, self.distance)
+        if key == self.key:
+            return False
+        self.key = key
+
         T0 = translationMatrix(self.center)
         R = np.matmul(rotationMatrixX(self.psi), rotationMatrixY(self.phi))
         T = translationMatrix([0., 0., -self.distance])
-        self.V = np.matmul(np.matmul(T, R), T0)#################################################################################
\ No newline at end of file
+        self.V = np.matmul(np.matmul(T, R), T0)
+        self.version += 1
+        return True
+#################################################################################
\ No newline at end of file
@@ -1,14 +1,23 @@
+import time
 import numpy as np
-import random as rand
 from LineModel import LineModel
+from FurModel import FurModel
 from material import Material
+from furparallel import grow_hair_parallel
+from furutils import calculate_hair_end_points, calculate_hair_ends, face_leaves, \
+    estimate_hair_bytes, hair_line_indices, level_offsets, make_seed, normalise, random_direction, root_scales, subdivide_level
+
+# default number of hairs grown per batch when streaming
+STREAM_BATCH = 50000
 
 
 class Fur:
     """
     Simple class that holds fur data
     """
-    def __init__(self, scene, vertices, normals, indices, length=0.1, iterations=3):
+    def __init__(self, scene, vertices, normals, indices, length=0.1, iterations=3, seed=None,
+                 cache=None, gpu_extrusion=False, workers=1, streaming=False, frame_ms=10, frame_hairs=None,
+                 compact=False, half_normals=False, memory_budget=None):
         """
         Constructor for fur object
         :param scene: Scene object to add the fur to
@@ -17,17 +26,58 @@ class Fur:
         :param indices: indices/faces of model to which fur will be added
         :param length: approximate length of the fur
         :param iterations: number of iterations for fur density
+        :param seed: seed of the fur random stream, an int or a numpy.random.Generator, random if None
+        :param cache: optional FurCache to load previously generated fur from
+        :param gpu_extrusion: bool, only upload the hair roots and extrude the hairs in the fur shader
+        :param workers: number of processes growing the fur, the result does not depend on it
+        :param streaming: bool, grow the fur progressively between frames rather than all at once
+        :param frame_ms: maximum time spent growing streamed fur per frame, in milliseconds, or None
+        :param frame_hairs: maximum number of streamed hairs grown per frame, or None
+        :param compact: bool, keep only one copy of the hairs on the CPU: no end point buffer, no normals duplicated
+        per end point, and no faces kept to grow the fur further
+        :param half_normals: bool, store and upload hair normals as float16
+        :param memory_budget: maximum estimated bytes of fur data, the density is lowered to fit, or None
         """
         print('Initialising Fur object')
 
-        self.vertices = vertices
+        # the GPU only takes float32 vertex data
+        self.vertices = np.asarray(vertices, dtype='f')
         self.indices = indices
         self.scene = scene
         self.length = length
-        self.vertices = vertices
-        self.normals = normals
+        self.normals = np.asarray(normals, dtype='f')
         self.iterations = iterations
 
+        # the same seed always grows the same hairs on the same faces
+        self.seed = make_seed(seed)
+        self.cache = cache
+        self.gpu_extrusion = gpu_extrusion
+        self.workers = workers
+        self.streaming = streaming
+        self.frame_ms = frame_ms
+        self.frame_hairs = frame_hairs
+        self.compact = compact
+        self.normal_dtype = np.float16 if half_normals else np.float32
+        self.memory_budget = memory_budget
+
+        # generator of the hairs still to grow when streaming
+        self.batches = None
+        # bool, whether the hairs point in a random direction
+        self.random_angle = False
+
+        # start points of every hair followed by their end points
+        self.hair_combined = None
+
+        # hairs grown so far, the hairs of every density are a prefix of the hairs of the next one
+        self.grown_vertices = None
+        self.grown_normals = None
+        self.grown_scales = None
+        self.grown_iterations = 0
+        # number of hairs at each density
+        self.level_counts = []
+        # faces subdivided at the deepest grown density
+        self.leaves = None
+
         self.material = Material(
                 Ka=np.array([0.0, 0.0, 0.0], 'f'),
                 Kd=np.array([0.5, 0.35, 0.25], 'f'),
@@ -37,156 +87,359 @@ class Fur:
 
         self.create_hair()
 
-    def calculate_hair_bulbs(self, hair_vertices, hair_normals, iterations):
+    def create_hair(self):
         """
-        Calculate the coordinates at which extra hairs will start, as well as their directions (normals)
-        :param hair_vertices: starting hair vertices
-        :param hair_normals: starting hair normals
+        Create hair line model based on self attributes
+        """
+        hair_combined = None
+        grown = False
+
+        self.fit_memory_budget()
+
+        if self.batches is not None:
+            # a streamed fur was not finished, drop it
+            self.batches = None
+            self.grown_vertices = None
+
+        # every density is a prefix of the higher ones, so only grow if the fur is not dense enough yet
+        if self.grown_vertices is None or self.iterations > self.grown_iterations:
+            if self.load_hair():
+                hair_combined = self.hair_combined
+            elif self.streaming:
+                self.start_stream()
+                return
+            elif self.workers > 1:
+                hair_combined = self.grow_hair_parallel()
+                grown = True
+            else:
+                self.grow_hair(self.iterations)
+                grown = True
+
+        # select the hairs of the current density
+        count = self.level_counts[self.iterations]
+        self.hair_vertices = self.grown_vertices[:count]
+        self.hair_normals = self.grown_normals[:count]
+        self.hair_scales = self.grown_scales[:count]
+
+        # calculate end points, unless the GPU extrudes them
+        if hair_combined is None and not self.gpu_extrusion:
+            hair_combined = self.calculate_hair_ends(self.hair_vertices, self.hair_normals, self.length)
+
+        if grown:
+            self.save_hair(hair_combined)
+
+        # create hair model
+        self.create_hair_model(hair_combined)
+
+    def reset_hair(self):
+        """
+        Start growing the fur again from the model vertices only
+        """
+        self.grown_vertices = self.vertices
+        self.grown_normals = normalise(self.normals).astype(self.normal_dtype, copy=False)
+        self.grown_scales = root_scales(self.vertices.shape[0], self.seed)
+        self.grown_iterations = 0
+        self.level_counts = [self.vertices.shape[0]]
+        self.leaves = None
+
+    def grow_hair(self, iterations):
+        """
+        Subdivide the faces of the deepest grown level until the fur reaches the given density
         :param iterations: hair density iterations
-        :return: hair_vertices, hair_normals
         """
+        # faces are not kept in the cache, so fur loaded from it has to be grown again from scratch
+        if self.grown_vertices is None or (self.leaves is None and self.grown_iterations > 0):
+            self.reset_hair()
+
+        if iterations <= self.grown_iterations:
+            return
+
         print('Calculating hair bulbs')
 
-        centroids = [[], []]
+        if self.leaves is None:
+            leaves = face_leaves(self.vertices, self.normals, self.indices)
+        else:
+            # split the faces of the deepest level into the faces of the next one
+            leaves = subdivide_level(*self.leaves, self.grown_iterations, self.seed)[3]
+
+        vertices = [self.grown_vertices]
+        normals = [self.grown_normals]
+        scales = [self.grown_scales]
+
+        for level in range(self.grown_iterations + 1, iterations + 1):
+            vert, norm, scale, next_leaves = subdivide_level(*leaves, level, self.seed, children=level < iterations)
+            vertices.append(vert)
+            normals.append(normalise(norm).astype(self.normal_dtype, copy=False))
+            scales.append(scale)
+            self.level_counts.append(self.level_counts[-1] + vert.shape[0])
+
+            if next_leaves is not None:
+                leaves = next_leaves
+
+        # keep the faces of the deepest level only, lower levels are never subdivided again
+        self.leaves = None if self.compact else leaves
+        self.grown_vertices = np.concatenate(vertices)
+        self.grown_normals = np.concatenate(normals)
+        self.grown_scales = np.concatenate(scales)
+        self.grown_iterations = iterations
+
+    def grow_hair_parallel(self):
+        """
+        Grow the fur of the current density from scratch in a process pool, with the same result as grow_hair()
+        :return: hair start points followed by end points
+        """
+        self.grown_vertices, self.grown_normals, self.grown_scales, self.hair_combined = grow_hair_parallel(
+            self.vertices, self.normals, self.indices, self.iterations, self.seed, self.length, self.workers,
+            normal_dtype=self.normal_dtype)
+        self.grown_iterations = self.iterations
+        self.level_counts = level_offsets(
+            self.vertices.shape[0], self.indices.shape[0], self.indices.shape[1], self.iterations)
+        self.leaves = None
 
-        if iterations > 0:
-            # check if model is built out of triangles or quads
-            if self.indices.shape[1] == 3:
-                # divide vertices and normals into a list of triangles
-                faces_vert = list(self.get_triangles(hair_vertices, self.indices))
-                faces_norm = list(self.get_triangles(hair_normals, self.indices))
+        return self.hair_combined
 
-            elif self.indices.shape[1] == 4:
-                # divide vertices and normals into a list of quads
-                faces_vert = list(self.get_quads(hair_vertices, self.indices))
-                faces_norm = list(self.get_quads(hair_normals, self.indices))
+    def start_stream(self):
+        """
+        Allocate the whole fur of the current density with no hair drawn, then grow it between frames
+        """
+        self.prepare_stream()
 
-            else:
-                print('(E) Model indices not quads or triangles.')
-                exit(1)
+        self.create_hair_model(self.hair_combined)
+        self.hair.draw_count = 0
 
-            # subdivide every face recursively
-            for i in range(len(faces_vert)):
-                returned_centroids = self.subdivide_faces(faces_vert[i], faces_norm[i], iterations)
-                # add returned centroids to list, separated into vertices and normals
-                centroids[0] += returned_centroids[0]
-                centroids[1] += returned_centroids[1]
+    def prepare_stream(self):
+        """
+        Allocate the whole fur of the current density, with only the hairs grown before written, and set the
+        batches growing the others. Fur grown to a lower density with its deepest faces kept is continued from
+        them, otherwise it is grown again from the model vertices.
+        """
+        print('Streaming hair bulbs')
+
+        # hairs and faces of the density grown so far, if the fur can be grown further from them
+        leaves = None
+        grown_count = 0
+        grown_iterations = 0
+        if self.grown_vertices is not None and self.leaves is not None and 0 < self.grown_iterations < self.iterations:
+            # split the faces of the deepest level into the faces of the next one
+            leaves = subdivide_level(*self.leaves, self.grown_iterations, self.seed)[3]
+            grown_iterations = self.grown_iterations
+            grown_count = self.level_counts[grown_iterations]
+
+        self.level_counts = level_offsets(
+            self.vertices.shape[0], self.indices.shape[0], self.indices.shape[1], self.iterations)
+        n_hairs = self.level_counts[-1]
+
+        grown = (self.grown_vertices, self.grown_normals, self.grown_scales)
+        self.grown_vertices = np.zeros((n_hairs, 3), dtype=self.vertices.dtype)
+        self.grown_normals = np.zeros((n_hairs, 3), dtype=self.normal_dtype)
+        self.grown_scales = np.zeros(n_hairs, dtype=np.uint8)
+        self.grown_iterations = grown_iterations
+        self.leaves = None
+
+        self.hair_vertices = self.grown_vertices
+        self.hair_normals = self.grown_normals
+        self.hair_scales = self.grown_scales
+        self.hair_combined = None if self.gpu_extrusion else np.zeros((2 * n_hairs, 3), dtype='f')
+
+        if grown_count > 0:
+            self.write_hairs(0, grown[0][:grown_count], grown[1][:grown_count], grown[2][:grown_count])
+
+        self.batches = self.iter_hair_batches(self.frame_hairs or STREAM_BATCH, leaves)
+
+    def iter_hair_batches(self, batch_size, leaves=None):
+        """
+        Grow the fur of the current density in batches, writing every batch where it goes in the allocated arrays.
+        Hairs are grown in order, so the hairs grown so far are always a prefix of the fur.
+        :param batch_size: maximum number of hairs per batch
+        :param leaves: faces to subdivide at the level after self.grown_iterations, whose hairs are already
+        written, or None to grow the fur from the model vertices
+        :return: generator of (first, last) indices of the hairs grown by every batch
+        """
+        offsets = self.level_counts
+        grown_iterations = self.grown_iterations
+
+        if leaves is None:
+            # hairs of the model vertices
+            n_vertices = self.vertices.shape[0]
+            self.write_hairs(0, self.vertices, normalise(self.normals), root_scales(n_vertices, self.seed))
+            yield 0, n_vertices
+
+            leaves = face_leaves(self.vertices, self.normals, self.indices)
+            grown_iterations = 0
+        else:
+            # hairs grown before only need uploading
+            yield 0, offsets[grown_iterations]
+
+        for level in range(grown_iterations + 1, self.iterations + 1):
+            first = offsets[level - 1]
+            children = []
+
+            for start in range(0, leaves[0].shape[0], batch_size):
+                batch = tuple(leaf[start:start + batch_size] for leaf in leaves)
+                vert, norm, scale, next_leaves = subdivide_level(*batch, level, self.seed,
+                                                                 children=level < self.iterations)
+                self.write_hairs(first, vert, normalise(norm), scale)
+                yield first, first + vert.shape[0]
+
+                first += vert.shape[0]
+                if next_leaves is not None:
+                    children.append(next_leaves)
+
+            if children:
+                leaves = tuple(np.concatenate(parts) for parts in zip(*children))
+
+        # keep the faces of the deepest level to grow the fur further
+        self.leaves = None if self.compact else leaves
+        self.grown_iterations = self.iterations
+
+    def write_hairs(self, first, vertices, normals, scales):
+        """
+        Write grown hairs and their end points into the fur arrays
+        :param first: index of the first hair
+        :param vertices: hair start points
+        :param normals: normalised hair normals
+        :param scales: random hair lengths, in tenths of the fur length
+        """
+        last = first + vertices.shape[0]
+        n_hairs = self.grown_vertices.shape[0]
 
-            # add newly found vertices and normals to original lists
-            hair_vertices = np.concatenate((hair_vertices, centroids[0]))
-            hair_normals = np.concatenate((hair_normals, centroids[1]))
-            # normalise new normals just in case
-            hair_normals /= np.linalg.norm(hair_normals, axis=1, keepdims=True)
+        self.grown_vertices[first:last] = vertices
+        self.grown_normals[first:last] = normals
+        self.grown_scales[first:last] = scales
 
-        return hair_vertices, hair_normals
+        if not self.gpu_extrusion:
+            # hairs follow their normals until the whole fur is grown, as a random direction needs all normals
+            self.hair_combined[first:last] = vertices
+            calculate_hair_end_points(vertices, normals, scales, self.length, self.seed,
+                                      out=self.hair_combined[n_hairs + first:n_hairs + last])
 
-    def create_hair(self):
+    def stream_step(self):
         """
-        Create hair line model based on self attributes
+        Grow and upload the next batches of a streamed fur, within the per frame budget
         """
-        # calculate starting points
-        self.hair_vertices, self.hair_normals = self.calculate_hair_bulbs(self.vertices, self.normals, self.iterations)
+        if self.batches is None:
+            return
 
-        # calculate end points
-        hair_combined = self.calculate_hair_ends(self.hair_vertices, self.hair_normals, self.length)
+        start_time = time.perf_counter()
+        hairs = 0
 
-        # create normals for every vertex
-        all_normals = []
-        for i in self.hair_normals:
-            all_normals.extend([i, i])
+        for first, last in self.batches:
+            self.upload_hairs(first, last)
+            hairs += last - first
 
-        # create hair model
-        self.hair = LineModel(scene=self.scene, vertices=np.array(hair_combined), normals=np.array(all_normals), material=self.material)
-        self.hair.bind()
-        self.scene.add_model(self.hair)
+            if self.frame_hairs is not None and hairs >= self.frame_hairs:
+                return
+            if self.frame_ms is not None and (time.perf_counter() - start_time) * 1000 >= self.frame_ms:
+                return
 
-    def get_triangles(self, vertices, indices):
-        """
-        Divide vertices list into a list of triangle faces based on indices data
-        :param vertices: model vertices
-        :param indices: model indices
-        :return: triangles list
-        """
-        triangles = []
-        for index in indices:
-            triangles.append([vertices[index[0]], vertices[index[1]], vertices[index[2]]])
-        return triangles
-
-    def get_quads(self, vertices, indices):
-        """
-        Divide vertices list into a list of quad faces based on indices data
-        :param vertices: model vertices
-        :param indices: model indices
-        :return: quads list
-        """
-        quads = []
-        for index in indices:
-            quads.append([vertices[index[0]], vertices[index[1]], vertices[index[2]], vertices[index[3]]])
-        return quads
-
-    def subdivide_faces(self, vertices, normals, n):
-        """
-        Subdivide face recursively to find more centroids
-        :param vertices: triangle or quad vertices
-        :param normals: triangle or quad normals
-        :param n: iterations
-        :return: [vert_centroids, norm_centroids]
-        """
-        if n == 0:
-            return [[], []]
-
-        # if vertices not triangles or quads, print error and abort
-        if len(vertices) != 3 and len(vertices) != 4:
-            print(
-                '(E) Error in Fur.subdivide_faces(): list does not contain 3 or 4 vertices, contains {}.'.format(
-                    len(vertices)))
-            exit(1)
-
-        # find centroids of face
-        vert_centroid = sum(vertices) / len(vertices)
-        norm_centroid = sum(normals) / len(normals)
-
-        # randomise position to avoid a visible pattern
-        # could randomise in a random direction, but this is sufficient as I don't want to add extra compute time
-        diff = vertices[0] - vert_centroid
-        vert_centroid += diff * (rand.randint(0, 5) / 10)
-
-        # add to list
-        vert_centroids = [vert_centroid]
-        norm_centroids = [norm_centroid]
-
-        # if more iterations, create new small triangles with centroid
-        if (n - 1) > 0:
-            if len(vertices) == 3:
-                # if face is a triangle, use original vertices and centroid to create 3 new small triangles
-                next_vert = [[vertices[0], vertices[1], vert_centroid],
-                             [vertices[0], vertices[2], vert_centroid],
-                             [vertices[1], vertices[2], vert_centroid]]
-                next_norm = [[normals[0], normals[1], norm_centroid],
-                             [normals[0], normals[2], norm_centroid],
-                             [normals[1], normals[2], norm_centroid]]
-            else:
-                # if face is a quad, use original vertices and centroid to create 4 new small triangles
-                next_vert = [[vertices[0], vertices[1], vert_centroid],
-                             [vertices[1], vertices[2], vert_centroid],
-                             [vertices[2], vertices[3], vert_centroid],
-                             [vertices[3], vertices[0], vert_centroid]]
-                next_norm = [[normals[0], normals[1], norm_centroid],
-                             [normals[1], normals[2], norm_centroid],
-                             [normals[2], normals[3], norm_centroid],
-                             [normals[3], normals[0], norm_centroid]]
-
-            # recursively subdivide each new triangle
-            for i in range(len(next_vert)):
-                ret = self.subdivide_faces(next_vert[i], next_norm[i], n - 1)
-                vert_centroids += ret[0]
-                norm_centroids += ret[1]
-
-        return [vert_centroids, norm_centroids]
+        # every hair has been grown
+        print('Finished streaming {} hairs.'.format(self.grown_vertices.shape[0]))
+        self.batches = None
+        self.hair.draw_count = None
+        self.save_hair(None if self.gpu_extrusion else self.hair_combined)
+
+        if self.random_angle:
+            self.update_hair_ends(True)
+
+        if self.compact and not self.gpu_extrusion:
+            self.hair.release_data()
+            self.hair_combined = None
+
+    def upload_hairs(self, first, last):
+        """
+        Upload newly grown hairs into the hair model buffers and draw them
+        :param first: index of the first hair
+        :param last: index after the last hair
+        """
+        if self.gpu_extrusion:
+            self.hair.update_vbo('position', self.grown_vertices[first:last], first=first)
+            self.hair.update_vbo('normal', self.grown_normals[first:last], first=first)
+            self.hair.update_vbo('hair_scale', self.grown_scales[first:last], first=first)
+            self.hair.draw_count = last
+            return
+
+        # start points and end points live in two halves of the buffers
+        n_hairs = self.grown_vertices.shape[0]
+        for offset in (0, n_hairs):
+            self.hair.update_vbo('position', self.hair_combined[offset + first:offset + last], first=offset + first)
+            self.hair.update_vbo('normal', self.grown_normals[first:last], first=offset + first)
+
+        # draw the line indices of the first `last` hairs
+        self.hair.draw_count = 2 * last
+
+    def estimate_bytes(self, iterations):
+        """
+        Estimate the bytes of fur data allocated on the CPU for a density
+        :param iterations: hair density iterations
+        :return: estimated bytes
+        """
+        return estimate_hair_bytes(
+            self.vertices.shape[0], self.indices.shape[0], self.indices.shape[1], iterations,
+            normal_bytes=3 * np.dtype(self.normal_dtype).itemsize, ends=not self.gpu_extrusion,
+            line_normals=not self.gpu_extrusion, leaves=not self.compact)
+
+    def fit_memory_budget(self):
+        """
+        Lower the density until the estimated fur data fits in the memory budget, and report its size
+        """
+        if self.memory_budget is not None:
+            while self.iterations > 0 and self.estimate_bytes(self.iterations) > self.memory_budget:
+                self.iterations -= 1
+
+        print('Fur of {} iterations: {} hairs, about {:.1f} MB'.format(
+            self.iterations,
+            level_offsets(self.vertices.shape[0], self.indices.shape[0], self.indices.shape[1], self.iterations)[-1],
+            self.estimate_bytes(self.iterations) / 2 ** 20))
+
+    def cache_key(self):
+        """
+        Key of the current fur in the cache
+        :return: key
+        """
+        return self.cache.key(self.vertices, self.normals, self.indices, self.iterations, self.length, self.seed,
+                              self.normal_dtype)
+
+    def load_hair(self):
+        """
+        Load the fur of the current density from the cache
+        :return: bool, whether the fur was cached
+        """
+        if self.cache is None:
+            return False
+
+        cached = self.cache.load(self.cache_key())
+        if cached is None:
+            return False
+
+        # reuse previously generated fur
+        self.grown_vertices = cached['hair_vertices']
+        self.grown_normals = cached['hair_normals'].astype(self.normal_dtype, copy=False)
+        self.grown_scales = cached['hair_scales']
+        self.grown_iterations = self.iterations
+        self.level_counts = level_offsets(
+            self.vertices.shape[0], self.indices.shape[0], self.indices.shape[1], self.iterations)
+        self.leaves = None
+
+        # end points are not cached for fur extruded on the GPU
+        self.hair_combined = cached.get('hair_combined')
+        return True
+
+    def save_hair(self, hair_combined):
+        """
+        Store the fur of the current density in the cache
+        :param hair_combined: hair start/end points, or None if they are extruded on the GPU
+        """
+        if self.cache is None:
+            return
+
+        arrays = dict(hair_vertices=self.hair_vertices, hair_normals=self.hair_normals, hair_scales=self.hair_scales)
+        if hair_combined is not None:
+            arrays['hair_combined'] = hair_combined
+        self.cache.save(self.cache_key(), **arrays)
 
     def calculate_hair_ends(self, vertices, normals, length, random_angle=False):
         """
-        Calculate the end points of each hair line and put into one list with start points
+        Calculate the end points of each hair line and put into one array with start points
         :param vertices: hair start point vertices
         :param normals: hair normals
         :param length: approximate hair length
@@ -195,26 +448,45 @@ class Fur:
         """
         print('Calculating hair ends')
 
-        # pick one normal to use for all hairs if random_angle is True
-        index = rand.randint(0, len(normals)-1)
-        normal = normals[index]
-
-        hair_combined = []
-        # iterate through each hair start point
-        for j in range(len(vertices)):
-            # random hair length
-            hair_length = length * (rand.randint(2, 10) / 10)
-            # add hair start point to new list
-            hair_combined.append(vertices[j])
-            if random_angle:
-                # add hair end point based on previously chosen normal
-                hair_combined.append((vertices[j] + normal * hair_length))
-            else:
-                # add hair end point based on the current hair's normal
-                hair_combined.append(vertices[j] + normals[j] * hair_length)
+        # reuse the previous buffer if the amount of hairs has not changed, cached fur is read-only
+        out = self.hair_combined
+        if out is not None and (out.shape[0] != 2 * vertices.shape[0] or not out.flags.writeable):
+            out = None
 
+        hair_combined = calculate_hair_ends(vertices, normals, self.hair_scales, length, self.seed, random_angle,
+                                            out=out)
+
+        # compact fur does not keep the end points once uploaded
+        if not self.compact:
+            self.hair_combined = hair_combined
         return hair_combined
 
+    def create_hair_model(self, hair_combined):
+        """
+        Create the hair line model from start/end points and add it to the scene
+        :param hair_combined: (2N, 3) array of hair start points followed by end points, unused on the GPU
+        """
+        if self.gpu_extrusion:
+            # only upload the roots, the shader extrudes the hairs
+            self.hair = FurModel(scene=self.scene, vertices=self.hair_vertices, normals=self.hair_normals,
+                                 scales=self.hair_scales, length=self.length, material=self.material)
+            self.hair.bind()
+            self.scene.add_model(self.hair)
+            return
+
+        # every hair uses its normal for both of its points
+        all_normals = np.concatenate((self.hair_normals, self.hair_normals))
+
+        self.hair = LineModel(scene=self.scene, vertices=hair_combined, normals=all_normals, material=self.material,
+                              indices=hair_line_indices(self.hair_vertices.shape[0]))
+        self.hair.bind()
+        self.scene.add_model(self.hair)
+
+        if self.compact and self.batches is None:
+            # the data is on the GPU now, drop the copies
+            self.hair.release_data()
+            self.hair_combined = None
+
     def update_density(self, iterations):
         """
         Update the density of the fur
@@ -222,15 +494,43 @@ class Fur:
         """
         print('Updating hair density to {} iterations.'.format(iterations))
 
-        # delete old hair model
+        # delete old hair model and free its buffers
         self.scene.remove_model(self.hair)
+        self.hair.release()
         del self.hair
 
         self.iterations = iterations
 
-        # create new hair model with new iterations
+        # create new hair model with new iterations, reusing the hairs already grown
         self.create_hair()
 
+    def update_hair_ends(self, random_angle=False):
+        """
+        Recalculate the hair end points and upload them in place of the old ones
+        :param random_angle: bool, random hair direction or based on normals?
+        """
+        self.random_angle = random_angle
+
+        if self.gpu_extrusion:
+            # length and direction are shader uniforms, no buffer needs updating
+            self.hair.length = self.length
+            self.hair.direction = random_direction(self.hair_normals, self.seed) if random_angle else None
+            # the hairs may reach further, so the scene needs their new bounds
+            self.scene.invalidate_matrices()
+            return
+
+        # start points do not move, so only the second half of the buffer needs uploading
+        n_hairs = self.hair_vertices.shape[0]
+        if self.compact:
+            ends = calculate_hair_end_points(self.hair_vertices, self.hair_normals, self.hair_scales, self.length,
+                                             self.seed, random_angle)
+        else:
+            hair_combined = self.calculate_hair_ends(self.hair_vertices, self.hair_normals, self.length, random_angle)
+            self.hair.vertices = hair_combined
+            ends = hair_combined[n_hairs:]
+
+        self.hair.update_vbo('position', ends, first=n_hairs)
+
     def update_length(self, length):
         """
         Update the length of the fur
@@ -238,24 +538,10 @@ class Fur:
         """
         print('Updating hair length to {}.'.format(length))
 
-        # delete old hair model
-        self.scene.remove_model(self.hair)
-        del self.hair
-
         self.length = length
 
-        # create just new hair endings rather than entire hair model from scratch to save compute time
-        hair_combined = self.calculate_hair_ends(self.hair_vertices, self.hair_normals, self.length)
-
-        # create normals for every vertex
-        all_normals = []
-        for i in self.hair_normals:
-            all_normals.extend([i, i])
-
-        # create new model with new endings
-        self.hair = LineModel(scene=self.scene, vertices=np.array(hair_combined), normals=np.array(all_normals), material=self.material)
-        self.hair.bind()
-        self.scene.add_model(self.hair)
+        # update just the hair endings rather than the entire hair model to save compute time
+        self.update_hair_ends()
 
     def update_rot(self, random_rot):
         """
@@ -264,19 +550,5 @@ class Fur:
         """
         print('Updating hair rotation.')
 
-        # delete old hair model
-        self.scene.remove_model(self.hair)
-        del self.hair
-
-        # create just new hair endings rather than entire hair model from scratch to save compute time
-        hair_combined = self.calculate_hair_ends(self.hair_vertices, self.hair_normals, self.length, random_rot)
-
-        # create normals for every vertex
-        all_normals = []
-        for i in self.hair_normals:
-            all_normals.extend([i, i])
-
-        # create new model with new endings
-        self.hair = LineModel(scene=self.scene, vertices=np.array(hair_combined), normals=np.array(all_normals), material=self.material)
-        self.hair.bind()
-        self.scene.add_model(self.hair)
+        # update just the hair endings rather than the entire hair model to save compute time
+        self.update_hair_ends(random_rot)
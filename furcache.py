@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import time
+import numpy as np
+
+# version of the layout of cached arrays, change it to invalidate old caches
+CACHE_VERSION = 2
+
+
+class FurCache:
+    """
+    Persistent on-disk cache of generated fur, stored as memory-mappable .npy files
+    """
+    def __init__(self, directory='.furcache', max_bytes=1024 * 1024 * 1024):
+        """
+        Initialise the cache
+        :param directory: folder where cached fur is stored
+        :param max_bytes: maximum size of the cache on disk, least recently used entries are evicted above it
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, vertices, normals, indices, iterations, length, seed, normal_dtype=np.float32):
+        """
+        Compute the cache key of a fur
+        :param vertices: vertices of the model
+        :param normals: normals of the model
+        :param indices: indices/faces of the model
+        :param iterations: number of iterations for fur density
+        :param length: approximate length of the fur
+        :param seed: int seed of the fur random stream
+        :param normal_dtype: dtype the hair normals are stored in, fur rounded to float16 is cached separately
+        :return: hex digest key
+        """
+        digest = hashlib.sha1(str(CACHE_VERSION).encode())
+        for array in (vertices, normals, indices):
+            array = np.ascontiguousarray(array)
+            digest.update('{}{}'.format(array.dtype.str, array.shape).encode())
+            digest.update(array.data)
+        digest.update('{}:{!r}:{}:{}'.format(iterations, float(length), seed, np.dtype(normal_dtype).str).encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Load a cached fur
+        :param key: cache key
+        :return: dictionary of read-only memory-mapped arrays, or None if the fur is not cached
+        """
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+
+        try:
+            arrays = {
+                file_name[:-4]: np.load(os.path.join(path, file_name), mmap_mode='r')
+                for file_name in os.listdir(path) if file_name.endswith('.npy')
+            }
+        except (OSError, ValueError) as error:
+            print('(W) Could not read cached fur {}: {}'.format(key, error))
+            return None
+
+        # mark entry as recently used
+        os.utime(path)
+        print('Loaded fur from cache {}'.format(key))
+        return arrays
+
+    def save(self, key, **arrays):
+        """
+        Store a fur in the cache, then evict old entries if the cache is too large
+        :param key: cache key
+        :param arrays: named arrays to store
+        """
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            print('(W) Fur of {} bytes is larger than the cache, not caching it.'.format(size))
+            return
+
+        path = os.path.join(self.directory, key)
+
+        # write into a temporary folder first, so that a crash never leaves a half written entry
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, '{}.npy'.format(name)), array)
+
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def entries(self):
+        """
+        List the cache entries
+        :return: list of (last use time, size in bytes, path), least recently used first
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path) or name.endswith('.tmp'):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+        """
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+
+        for last_use, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            print('Evicting cached fur {} (last used {})'.format(
+                os.path.basename(path), time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_use))))
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
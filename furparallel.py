@@ -0,0 +1,112 @@
+"""
+Multi-process fur generation, the model faces are split into chunks grown in a process pool.
+Arrays are shared with the worker processes through shared memory, so no large array is pickled.
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sharedarrays import SharedArrays
+from furutils import calculate_hair_end_points, face_leaves, level_offsets, level_sizes, normalise, root_scales, \
+    subdivide_level
+
+
+def grow_chunk(specs, first, last, iterations, seed, length):
+    """
+    Grow the hairs of the faces first..last-1 and write them where they go in the whole fur.
+    Faces are subdivided in order, so the hairs of a chunk are contiguous within every iteration.
+    :param specs: SharedArrays.specs of the model and hair arrays
+    :param first: index of the first face of the chunk
+    :param last: index after the last face of the chunk
+    :param iterations: hair density iterations
+    :param seed: int seed of the random stream
+    :param length: approximate hair length
+    """
+    shared = SharedArrays.attach(specs)
+    arrays = shared.arrays
+    indices = arrays['indices']
+    n_hairs = arrays['hair_vertices'].shape[0]
+
+    offsets = level_offsets(arrays['vertices'].shape[0], indices.shape[0], indices.shape[1], iterations)
+    sizes = [1] + level_sizes(1, indices.shape[1], iterations)[1:]
+
+    leaves = face_leaves(arrays['vertices'], arrays['normals'], indices[first:last], np.arange(first, last))
+    for level in range(1, iterations + 1):
+        vert, norm, scale, next_leaves = subdivide_level(*leaves, level, seed, children=level < iterations)
+
+        start = offsets[level - 1] + first * sizes[level - 1]
+        end = start + vert.shape[0]
+        arrays['hair_vertices'][start:end] = vert
+        arrays['hair_normals'][start:end] = normalise(norm)
+        arrays['hair_scales'][start:end] = scale
+        # end points follow the normals as stored, EG. rounded to float16, like in the single process path
+        calculate_hair_end_points(vert, arrays['hair_normals'][start:end], scale, length, seed,
+                                  out=arrays['hair_combined'][n_hairs + start:n_hairs + end])
+
+        leaves = next_leaves
+
+    del arrays, indices
+    shared.close()
+
+
+def grow_hair_parallel(vertices, normals, indices, iterations, seed, length, workers, chunks_per_worker=4,
+                       normal_dtype=np.float32):
+    """
+    Grow the fur in a process pool, giving the same bytes as Fur.grow_hair() and calculate_hair_ends()
+    :param vertices: model vertices
+    :param normals: model normals
+    :param indices: (F, 3) or (F, 4) array of faces
+    :param iterations: hair density iterations
+    :param seed: int seed of the random stream
+    :param length: approximate hair length
+    :param workers: number of worker processes
+    :param chunks_per_worker: number of face chunks per worker, to balance the load
+    :param normal_dtype: dtype the hair normals are stored in, end points are computed from the stored normals
+    :return: hair_vertices, hair_normals, hair_scales, hair_combined
+    """
+    print('Calculating hair bulbs and ends in {} processes'.format(workers))
+
+    n_vertices = vertices.shape[0]
+    n_hairs = level_offsets(n_vertices, indices.shape[0], indices.shape[1], iterations)[-1]
+
+    shared = SharedArrays({
+        'vertices': (vertices.shape, vertices.dtype),
+        'normals': (normals.shape, normals.dtype),
+        'indices': (indices.shape, indices.dtype),
+        'hair_vertices': ((n_hairs, 3), vertices.dtype),
+        'hair_normals': ((n_hairs, 3), normal_dtype),
+        'hair_scales': ((n_hairs,), np.uint8),
+        'hair_combined': ((2 * n_hairs, 3), np.float32),
+    })
+    try:
+        arrays = shared.arrays
+        arrays['vertices'][:] = vertices
+        arrays['normals'][:] = normals
+        arrays['indices'][:] = indices
+
+        # hairs of the model vertices
+        arrays['hair_vertices'][:n_vertices] = vertices
+        arrays['hair_normals'][:n_vertices] = normalise(normals)
+        arrays['hair_scales'][:n_vertices] = root_scales(n_vertices, seed)
+        calculate_hair_end_points(vertices, arrays['hair_normals'][:n_vertices], arrays['hair_scales'][:n_vertices],
+                                  length, seed, out=arrays['hair_combined'][n_hairs:n_hairs + n_vertices])
+
+        if iterations > 0:
+            bounds = np.linspace(0, indices.shape[0], workers * chunks_per_worker + 1).astype(int)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(grow_chunk, shared.specs, first, last, iterations, seed, length)
+                    for first, last in zip(bounds[:-1], bounds[1:]) if last > first
+                ]
+                for future in futures:
+                    # forward any exception raised in a worker
+                    future.result()
+
+        # start points of all hairs
+        arrays['hair_combined'][:n_hairs] = arrays['hair_vertices']
+
+        # copy out of the shared memory before freeing it
+        return tuple(np.array(arrays[name])
+                     for name in ('hair_vertices', 'hair_normals', 'hair_scales', 'hair_combined'))
+    finally:
+        arrays = None
+        shared.close(unlink=True)
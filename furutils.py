@@ -0,0 +1,314 @@
+"""
+Furutils file, batched NumPy helpers for generating fur
+"""
+
+import numpy as np
+
+# pairs of face corners joined with the face centroid to create the next level of triangles
+TRIANGLE_SPLITS = np.array([[0, 1], [0, 2], [1, 2]])
+QUAD_SPLITS = np.array([[0, 1], [1, 2], [2, 3], [3, 0]])
+
+# independent random streams derived from the same counters
+JITTER_STREAM = 1
+LENGTH_STREAM = 2
+ANGLE_STREAM = 3
+
+
+def make_seed(seed=None):
+    """
+    Turn the seed given to the fur into a 64 bit integer
+    :param seed: None for a fresh random seed, an int, or a numpy.random.Generator to draw the seed from
+    :return: int seed
+    """
+    if isinstance(seed, np.random.Generator):
+        return int(seed.integers(0, 2 ** 63))
+    if seed is None:
+        return int(np.random.SeedSequence().entropy % 2 ** 64)
+    return int(seed) % 2 ** 64
+
+
+def mix64(x):
+    """
+    SplitMix64 finaliser, scrambles every bit of a uint64 array
+    :param x: uint64 array
+    :return: scrambled uint64 array
+    """
+    with np.errstate(over='ignore'):
+        x = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def counter_keys(seed, *counters):
+    """
+    Hash the seed and a set of counters (EG. face, iteration depth, child) into one random key per element.
+    The same counters always give the same key, whatever order the elements are processed in.
+    :param seed: int seed
+    :param counters: integer arrays or scalars, broadcast together
+    :return: uint64 array of keys
+    """
+    keys = mix64(np.uint64(seed))
+    for counter in counters:
+        keys = mix64(keys ^ np.asarray(counter).astype(np.uint64))
+    return keys
+
+
+def random_ints(keys, stream, low, high):
+    """
+    Draw one random integer in [low, high] per key
+    :param keys: uint64 array of keys from counter_keys()
+    :param stream: random stream, so that one key can give several independent values
+    :param low: lowest value
+    :param high: highest value (inclusive)
+    :return: int64 array of random values
+    """
+    values = mix64(keys ^ np.uint64(stream)) % np.uint64(high - low + 1)
+    return values.astype(np.int64) + low
+
+
+def get_faces(vertices, indices):
+    """
+    Gather the corners of every face into one array
+    :param vertices: (V, 3) array of per vertex data (positions or normals)
+    :param indices: (F, 3) or (F, 4) array of faces
+    :return: (F, 3, 3) or (F, 4, 3) array of face corners
+    """
+    return vertices[indices]
+
+
+def subdivide_level(faces_vert, faces_norm, face_ids, local_ids, level, seed, children=True):
+    """
+    Compute the centroids of a batch of faces and, if needed, split them into the next level of triangles
+    :param faces_vert: (F, 3, 3) or (F, 4, 3) array of face vertices
+    :param faces_norm: (F, 3, 3) or (F, 4, 3) array of face normals
+    :param face_ids: (F,) index of the model face each face comes from
+    :param local_ids: (F,) index of each face among the faces of the same level within its model face
+    :param level: iteration depth of the faces, starting at 1
+    :param seed: int seed of the random stream
+    :param children: bool, create the next level of triangles or not
+    :return: vert_centroids, norm_centroids, scales, (next_vert, next_norm, next_face_ids, next_local_ids)
+    """
+    corners = faces_vert.shape[1]
+    if corners == 3:
+        splits = TRIANGLE_SPLITS
+    elif corners == 4:
+        splits = QUAD_SPLITS
+    else:
+        print('(E) Error in furutils.subdivide_level(): faces do not contain 3 or 4 vertices, contain {}.'.format(
+            corners))
+        exit(1)
+
+    keys = counter_keys(seed, face_ids, level, local_ids)
+
+    # find centroids of every face
+    vert_centroids = faces_vert.mean(axis=1)
+    norm_centroids = faces_norm.mean(axis=1)
+
+    # randomise position towards the first vertex to avoid a visible pattern
+    jitter = (random_ints(keys, JITTER_STREAM, 0, 5) / 10).astype(faces_vert.dtype)
+    vert_centroids += (faces_vert[:, 0] - vert_centroids) * jitter[:, None]
+
+    # random hair length, in tenths of the fur length
+    scales = random_ints(keys, LENGTH_STREAM, 2, 10).astype(np.uint8)
+
+    if not children:
+        return vert_centroids, norm_centroids, scales, None
+
+    # every pair of corners forms a new small triangle with the centroid, (F, P, 3, 3) flattened to (F * P, 3, 3)
+    next_vert = np.stack((
+        faces_vert[:, splits[:, 0]],
+        faces_vert[:, splits[:, 1]],
+        np.broadcast_to(vert_centroids[:, None], (faces_vert.shape[0], len(splits), 3))
+    ), axis=2).reshape(-1, 3, 3)
+    next_norm = np.stack((
+        faces_norm[:, splits[:, 0]],
+        faces_norm[:, splits[:, 1]],
+        np.broadcast_to(norm_centroids[:, None], (faces_norm.shape[0], len(splits), 3))
+    ), axis=2).reshape(-1, 3, 3)
+
+    # children keep the model face they come from, and get a unique index within it
+    next_face_ids = np.repeat(face_ids, len(splits))
+    next_local_ids = (local_ids[:, None] * len(splits) + np.arange(len(splits))).reshape(-1)
+
+    return vert_centroids, norm_centroids, scales, (next_vert, next_norm, next_face_ids, next_local_ids)
+
+
+def face_leaves(vertices, normals, indices, face_ids=None):
+    """
+    Create the faces subdivided at the first iteration
+    :param vertices: model vertices
+    :param normals: model normals
+    :param indices: (F, 3) or (F, 4) array of faces
+    :param face_ids: index of every given face in the whole model, defaults to 0..F-1
+    :return: (faces_vert, faces_norm, face_ids, local_ids) as used by subdivide_level()
+    """
+    if indices.shape[1] != 3 and indices.shape[1] != 4:
+        print('(E) Model indices not quads or triangles.')
+        exit(1)
+
+    if face_ids is None:
+        face_ids = np.arange(indices.shape[0])
+
+    return get_faces(vertices, indices), get_faces(normals, indices), face_ids, np.zeros(len(face_ids), dtype=np.int64)
+
+
+def level_sizes(n_faces, corners, iterations):
+    """
+    Number of hairs created at each iteration
+    :param n_faces: number of model faces
+    :param corners: 3 for triangles, 4 for quads
+    :param iterations: hair density iterations
+    :return: list of hair counts for iterations 1..iterations
+    """
+    # every face creates one centroid, then splits into `corners` triangles, which then split into 3 triangles
+    return [n_faces * (corners if level > 1 else 1) * 3 ** max(level - 2, 0) for level in range(1, iterations + 1)]
+
+
+def level_offsets(n_vertices, n_faces, corners, iterations):
+    """
+    Index of the first hair of every iteration, hairs of the model vertices coming first
+    :param n_vertices: number of model vertices
+    :param n_faces: number of model faces
+    :param corners: 3 for triangles, 4 for quads
+    :param iterations: hair density iterations
+    :return: list of offsets for iterations 1..iterations, followed by the total number of hairs
+    """
+    return list(np.cumsum([n_vertices] + level_sizes(n_faces, corners, iterations)))
+
+
+def estimate_hair_bytes(n_vertices, n_faces, corners, iterations, normal_bytes=12, ends=True, line_normals=True,
+                        leaves=True):
+    """
+    Estimate the bytes of fur data allocated on the CPU
+    :param n_vertices: number of model vertices
+    :param n_faces: number of model faces
+    :param corners: 3 for triangles, 4 for quads
+    :param iterations: hair density iterations
+    :param normal_bytes: bytes of one hair normal
+    :param ends: bool, whether a start/end point buffer is allocated
+    :param line_normals: bool, whether normals are duplicated for both points of every line
+    :param leaves: bool, whether the faces of the deepest level are kept
+    :return: estimated bytes
+    """
+    offsets = level_offsets(n_vertices, n_faces, corners, iterations)
+    n_hairs = offsets[-1]
+
+    # start point, normal and quantised length of every hair
+    size = n_hairs * (12 + normal_bytes + 1)
+    if ends:
+        size += n_hairs * 2 * 12
+    if line_normals:
+        size += n_hairs * 2 * normal_bytes
+    if leaves and iterations > 0:
+        # vertices and normals of the 3 corners of every face of the deepest level
+        size += (offsets[-1] - offsets[-2]) * 2 * 3 * 12
+    return int(size)
+
+
+def normalise(vectors):
+    """
+    Normalise an array of vectors
+    :param vectors: (N, 3) array
+    :return: (N, 3) array of unit vectors
+    """
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def root_scales(n_vertices, seed):
+    """
+    Random hair lengths of the hairs growing from the model vertices
+    :param n_vertices: number of model vertices
+    :param seed: int seed of the random stream
+    :return: (n_vertices,) uint8 array of lengths, in tenths of the fur length
+    """
+    # vertex hairs use depth 0, which subdivision never does
+    keys = counter_keys(seed, np.arange(n_vertices), 0, 0)
+    return random_ints(keys, LENGTH_STREAM, 2, 10).astype(np.uint8)
+
+
+def hair_line_indices(n_hairs):
+    """
+    Index array drawing every hair as one line from its start point to its end point
+    :param n_hairs: number of hairs
+    :return: (N, 2) uint32 array of indices
+    """
+    starts = np.arange(n_hairs, dtype=np.uint32)
+    return np.stack((starts, starts + np.uint32(n_hairs)), axis=1)
+
+
+def random_direction(normals, seed):
+    """
+    Pick the normal that all hairs point along when the fur direction is random
+    :param normals: (N, 3) array of hair normals
+    :param seed: int seed of the random stream
+    :return: (3,) float32 direction
+    """
+    return np.asarray(normals[random_ints(counter_keys(seed), ANGLE_STREAM, 0, normals.shape[0] - 1)], dtype='f')
+
+
+def hair_root_buffers(vertices, normals, scales):
+    """
+    Vertex buffers uploaded when hairs are extruded on the GPU, one row per hair.
+    The shader computes the same end points as calculate_hair_end_points().
+    :param vertices: (N, 3) array of hair start points
+    :param normals: (N, 3) array of hair normals
+    :param scales: (N,) random hair lengths, in tenths of the fur length
+    :return: dictionary of attribute name to contiguous array
+    """
+    return {
+        'position': np.ascontiguousarray(vertices, dtype='f'),
+        'normal': np.ascontiguousarray(normals, dtype=np.float16 if normals.dtype == np.float16 else 'f'),
+        'hair_scale': np.ascontiguousarray(scales, dtype=np.uint8),
+    }
+
+
+def calculate_hair_end_points(vertices, normals, scales, length, seed, random_angle=False, out=None):
+    """
+    Calculate the end point of each hair line
+    :param vertices: (N, 3) array of hair start points
+    :param normals: (N, 3) array of hair normals
+    :param scales: (N,) random hair lengths, in tenths of the fur length
+    :param length: approximate hair length
+    :param seed: int seed of the random stream
+    :param random_angle: bool, random hair direction or based on normals?
+    :param out: optional preallocated (N, 3) float32 buffer to write into
+    :return: (N, 3) float32 array of end points
+    """
+    if out is None:
+        out = np.empty((vertices.shape[0], 3), dtype='f')
+
+    hair_lengths = (scales[:, None] * (length / 10)).astype('f')
+
+    if random_angle:
+        directions = random_direction(normals, seed)
+    else:
+        directions = normals
+
+    np.multiply(directions, hair_lengths, out=out)
+    out += vertices
+
+    return out
+
+
+def calculate_hair_ends(vertices, normals, scales, length, seed, random_angle=False, out=None):
+    """
+    Calculate the end points of each hair line and put them after the start points, so that they can be
+    updated on their own
+    :param vertices: (N, 3) array of hair start points
+    :param normals: (N, 3) array of hair normals
+    :param scales: (N,) random hair lengths, in tenths of the fur length
+    :param length: approximate hair length
+    :param seed: int seed of the random stream
+    :param random_angle: bool, random hair direction or based on normals?
+    :param out: optional preallocated (2N, 3) float32 buffer to write into
+    :return: (2N, 3) float32 array of start points followed by end points
+    """
+    n_hairs = vertices.shape[0]
+    if out is None:
+        out = np.empty((2 * n_hairs, 3), dtype='f')
+
+    out[:n_hairs] = vertices
+    calculate_hair_end_points(vertices, normals, scales, length, seed, random_angle, out=out[n_hairs:])
+
+    return out
@@ -22,10 +22,12 @@ class MaterialLibrary:
     """
     Material library class that holds materials
     """
-    def __init__(self):
+    def __init__(self, file_name=None):
         """
         Initialise library
+        :param file_name: path to the mtl file the library was loaded from, if any
         """
+        self.file_name = file_name
         self.materials = []
         self.names = {}
 
@@ -5,8 +5,7 @@ Matutils file taken from workshops
 import numpy as np
 
 def scaleMatrix(s):
-    s.append(1)
-    return np.diag(s)
+    return np.diag(np.append(np.asarray(s, dtype='f'), 1).astype('f'))
 
 def translationMatrix(t):
     n = len(t)
@@ -17,7 +16,7 @@ def translationMatrix(t):
 def rotationMatrixZ(angle):
     c = np.cos(angle)
     s = np.sin(angle)
-    R = np.identity(4)
+    R = np.identity(4, dtype='f')
     R[0,0] = c
     R[0,1] = s
     R[1,0] = -s
@@ -27,7 +26,7 @@ def rotationMatrixZ(angle):
 def rotationMatrixX(angle):
     c = np.cos(angle)
     s = np.sin(angle)
-    R = np.identity(4)
+    R = np.identity(4, dtype='f')
     R[1,1] = c
     R[1,2] = s
     R[2,1] = -s
@@ -37,7 +36,7 @@ def rotationMatrixX(angle):
 def rotationMatrixY(angle):
     c = np.cos(angle)
     s = np.sin(angle)
-    R = np.identity(4)
+    R = np.identity(4, dtype='f')
     R[0,0] = c
     R[0,2] = s
     R[2,0] = -s
@@ -82,7 +81,7 @@ def orthoMatrix(l,r,t,b,n,f):
         [0.,            -2./(t-b),   0.,         (t+b)/(t-b) ],
         [0.,            0.,         2./(f-n),  (f+n)/(f-n) ],
         [0.,            0.,         0.,         1.          ]
-        ]
+        ], dtype='f'
     )
 
 def frustumMatrix(l,r,t,b,n,f):
@@ -92,10 +91,76 @@ def frustumMatrix(l,r,t,b,n,f):
             [ 0,              -2*n/(t-b),  (t+b)/(t-b),    0 ],
             [ 0,              0,          -(f+n)/(f-n),   -2*f*n/(f-n) ],
             [ 0,              0,          -1,             0 ]
-            ]
+            ], dtype='f'
     )
 
 
+def stackMatrices(matrices):
+    '''
+    Stack 4x4 matrices, EG. the model matrices of a scene, into one array
+    :param matrices: list of N 4x4 matrices
+    :return: (N,4,4) float32 array
+    '''
+    return np.array(matrices, dtype='f').reshape(-1, 4, 4)
+
+
+def modelViewMatrices(P, V, M):
+    '''
+    Compute the matrices needed to draw N models with a single call for each
+    :param P: 4x4 projection matrix
+    :param V: 4x4 view matrix
+    :param M: (N,4,4) model matrices
+    :return: (PVM, VM, VMiT): (N,4,4) projection view model, (N,4,4) view model and (N,3,3) inverse-transpose
+    of the rotation part of the view model matrices, all float32
+    '''
+    VM = np.einsum('ij,njk->nik', np.asarray(V, dtype='f'), np.asarray(M, dtype='f'))
+    PVM = np.einsum('ij,njk->nik', np.asarray(P, dtype='f'), VM)
+    VMiT = np.linalg.inv(VM[:, :3, :3]).transpose(0, 2, 1)
+    return PVM, VM, VMiT
+
+
+def frustumPlanes(PV):
+    '''
+    Extract the planes of the view frustum
+    :param PV: 4x4 projection view matrix
+    :return: (6,4) float32 array of the left, right, bottom, top, near and far planes (a,b,c,d) in world space,
+    with normalised (a,b,c) pointing inside the frustum
+    '''
+    PV = np.asarray(PV, dtype='f')
+    planes = np.array([PV[3] + PV[0], PV[3] - PV[0], PV[3] + PV[1], PV[3] - PV[1], PV[3] + PV[2], PV[3] - PV[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def boundsInFrustum(planes, M, box_min, box_max, centers, radii):
+    '''
+    Test the bounding volumes of N models against the view frustum, the test is conservative so a model may be
+    kept when it is just outside of a corner of the frustum
+    :param planes: (6,4) frustum planes, see frustumPlanes()
+    :param M: (N,4,4) model matrices
+    :param box_min: (N,3) minimum corners of the axis aligned bounding boxes in model space
+    :param box_max: (N,3) maximum corners of the axis aligned bounding boxes in model space
+    :param centers: (N,3) centers of the bounding spheres in model space
+    :param radii: (N,) radii of the bounding spheres in model space
+    :return: (N,) bool array, False for the models entirely outside of the frustum
+    '''
+    R = M[:, :3, :3]
+    t = M[:, :3, 3]
+
+    # spheres in world space, the radius is scaled by the largest scale of the model matrix
+    world_centers = np.einsum('nij,nj->ni', R, centers) + t
+    world_radii = radii * np.linalg.norm(R, axis=1).max(axis=1)
+    distances = np.dot(world_centers, planes[:, :3].T) + planes[:, 3]
+    inside = np.all(distances >= -world_radii[:, None], axis=1)
+
+    # boxes in world space, as centers and half extents along the world axes
+    box_centers = np.einsum('nij,nj->ni', R, (box_min + box_max) / 2) + t
+    extents = np.einsum('nij,nj->ni', np.abs(R), (box_max - box_min) / 2)
+    distances = np.dot(box_centers, planes[:, :3].T) + planes[:, 3]
+    inside &= np.all(distances >= -np.dot(extents, np.abs(planes[:, :3]).T), axis=1)
+
+    return inside
+
+
 # Homogeneous coordinates helpers
 def homog(v):
     return np.hstack([v,1])
@@ -1,23 +1,41 @@
 from material import Material
 import numpy as np
 
+
+def triangulate(faces):
+    """
+    Split quad faces into two triangles along their 0-2 diagonal, triangles are returned unchanged
+    :param faces: (F, 3) or (F, 4) array of faces
+    :return: (F, 3) or (2F, 3) array of triangles, both triangles of a quad being next to each other
+    """
+    faces = np.asarray(faces)
+    if faces.shape[1] == 3:
+        return faces
+    return faces[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+
+
 class Mesh:
     """
     Simple class that holds mesh data
     """
-    def __init__(self, vertices, faces=None, normals=None, material=Material()):
+    def __init__(self, vertices, faces=None, normals=None, material=Material(), texture_coords=None):
         """
         Initialise mesh object
         :param vertices: mesh vertices
         :param faces: mesh faces
         :param normals: mesh normals
         :param material: mesh material
+        :param texture_coords: mesh texture coordinates
         """
 
         # assign arguments to attributes
         self.vertices = vertices
         self.faces = faces
         self.material = material
+        self.texture_coords = texture_coords
+
+        # triangles to draw, quads are not available in core OpenGL profiles
+        self.triangles = None if faces is None else triangulate(faces)
 
         print('Creating mesh')
         print('- {} vertices, {} faces'.format(self.vertices.shape[0], self.faces.shape[0]))
@@ -33,22 +51,43 @@ class Mesh:
         else:
             self.normals = normals
 
-    def calculate_normals(self):
+    def calculate_normals(self, weighting='area'):
         """
-        Calculate normals from mesh faces
+        Calculate normals from mesh faces, quads are split into two triangles
+        :param weighting: 'area' to weight the normal of each face by its area, or 'angle' to weight it by the
+        angle of the face at the vertex
         """
 
-        self.normals = np.zeros((self.vertices.shape[0], 3), dtype='f')
+        faces = self.triangles
+        corners = self.vertices[faces]
+
+        # calculate all face normals at once using cross product of triangle sides, the length of each face
+        # normal is twice the area of the face
+        face_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
 
-        for f in range(self.faces.shape[0]):
-            # calculate the face normal using cross product of triangle sides
-            a = self.vertices[self.faces[f, 1]] - self.vertices[self.faces[f, 0]]
-            b = self.vertices[self.faces[f, 2]] - self.vertices[self.faces[f, 0]]
-            face_normal = np.cross(a, b)
+        if weighting == 'area':
+            weights = np.repeat(face_normals[:, None, :], 3, axis=1)
+        elif weighting == 'angle':
+            # angle at each corner between the two sides of the face meeting there
+            sides_a = np.roll(corners, -1, axis=1) - corners
+            sides_b = np.roll(corners, 1, axis=1) - corners
+            cosines = np.sum(sides_a * sides_b, axis=2) / np.maximum(
+                np.linalg.norm(sides_a, axis=2) * np.linalg.norm(sides_b, axis=2), 1e-30)
+            angles = np.arccos(np.clip(cosines, -1., 1.))
+
+            lengths = np.linalg.norm(face_normals, axis=1, keepdims=True)
+            unit_normals = face_normals / np.where(lengths > 0, lengths, 1.)
+            weights = angles[:, :, None] * unit_normals[:, None, :]
+        else:
+            raise ValueError('Unknown normal weighting: {}'.format(weighting))
 
-            # blend normal on all 3 vertices
-            for j in range(3):
-                self.normals[self.faces[f, j], :] += face_normal
+        # blend the face normals on their vertices
+        indices = faces.ravel()
+        weights = weights.reshape(-1, 3)
+        self.normals = np.stack([
+            np.bincount(indices, weights=weights[:, k], minlength=self.vertices.shape[0]) for k in range(3)
+        ], axis=1).astype('f')
 
-        # normalise the vectors
-        self.normals /= np.linalg.norm(self.normals, axis=1, keepdims=True)
+        # normalise the vectors, vertices of degenerate faces only keep a zero normal
+        lengths = np.linalg.norm(self.normals, axis=1, keepdims=True)
+        self.normals /= np.where(lengths > 0, lengths, 1.)
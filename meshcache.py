@@ -0,0 +1,201 @@
+"""
+Binary cache of the meshes of an obj file, stored next to it so that later loads are a memory map instead of a parse.
+
+File layout:
+- 8 bytes magic, uint32 format version, uint32 header length
+- JSON header: source files stamps, material table, and offset/shape/dtype of every array block
+- raw float32 vertex, normal and texture coordinates blocks and uint32 face blocks, each aligned to
+  BLOCK_ALIGNMENT bytes
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from material import Material
+from mesh import Mesh
+
+MAGIC = b'OBJCACHE'
+# version of the file layout and of the loaded meshes, change it to invalidate old caches
+MESH_CACHE_VERSION = 3
+BLOCK_ALIGNMENT = 64
+
+# dtype of each block of a mesh, texture coordinates are optional
+BLOCK_DTYPES = {
+    'vertices': np.float32,
+    'normals': np.float32,
+    'faces': np.uint32,
+    'texture_coords': np.float32,
+}
+
+
+def mesh_cache_path(file_name):
+    """
+    :param file_name: path to the obj file
+    :return: path of its mesh cache
+    """
+    return file_name + '.meshcache'
+
+
+def file_hash(file_name):
+    """
+    :param file_name: path to a file
+    :return: sha1 hex digest of the file content
+    """
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as source:
+        for chunk in iter(lambda: source.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_stamp(file_name):
+    """
+    Stamp of a source file, used to invalidate the cache when the file changes
+    :param file_name: path to the source file
+    :return: dictionary of path, modification time, size and hash
+    """
+    stat = os.stat(file_name)
+    return {'path': file_name, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': file_hash(file_name)}
+
+
+def source_changed(stamp):
+    """
+    Check a source file against its stamp. The modification time is checked first so that the file is only
+    hashed when it was touched.
+    :param stamp: stamp stored in the cache
+    :return: True if the file changed or is missing
+    """
+    try:
+        stat = os.stat(stamp['path'])
+    except OSError:
+        return True
+
+    if stat.st_size != stamp['size']:
+        return True
+    if stat.st_mtime_ns == stamp['mtime_ns']:
+        return False
+    return file_hash(stamp['path']) != stamp['sha1']
+
+
+def material_to_json(material):
+    """
+    :param material: Material
+    :return: dictionary of the material attributes
+    """
+    return {name: (np.asarray(value).tolist() if isinstance(value, (list, np.ndarray)) else value)
+            for name, value in vars(material).items()}
+
+
+def material_from_json(attributes):
+    """
+    :param attributes: dictionary of the material attributes
+    :return: Material
+    """
+    material = Material(attributes['name'])
+    for name, value in attributes.items():
+        setattr(material, name, np.array(value, 'f') if isinstance(value, list) else value)
+    return material
+
+
+def save_mesh_cache(file_name, meshes, sources):
+    """
+    Write the mesh cache of an obj file
+    :param file_name: path to the obj file
+    :param meshes: meshes loaded from the file
+    :param sources: paths of the files the meshes were loaded from, EG. the obj and mtl files
+    """
+    # meshes may share materials, store each one once
+    materials = []
+    material_ids = {}
+    for mesh in meshes:
+        if id(mesh.material) not in material_ids:
+            material_ids[id(mesh.material)] = len(materials)
+            materials.append(material_to_json(mesh.material))
+
+    blocks = []
+    header = {'sources': [source_stamp(source) for source in sources], 'materials': materials, 'meshes': []}
+    offset = 0
+    for mesh in meshes:
+        entry = {'material': material_ids[id(mesh.material)]}
+        for name, dtype in BLOCK_DTYPES.items():
+            if getattr(mesh, name) is None:
+                continue
+            block = np.ascontiguousarray(getattr(mesh, name), dtype=dtype)
+            entry[name] = {'offset': offset, 'shape': list(block.shape), 'dtype': np.dtype(dtype).str}
+            blocks.append(block)
+            offset += -(-block.nbytes // BLOCK_ALIGNMENT) * BLOCK_ALIGNMENT
+        header['meshes'].append(entry)
+
+    header = json.dumps(header).encode()
+    # blocks start after the header, at an aligned offset
+    data_offset = -(-(len(MAGIC) + 8 + len(header)) // BLOCK_ALIGNMENT) * BLOCK_ALIGNMENT
+
+    path = mesh_cache_path(file_name)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as cache:
+            cache.write(MAGIC)
+            cache.write(np.array([MESH_CACHE_VERSION, len(header)], dtype='<u4').tobytes())
+            cache.write(header)
+            for block in blocks:
+                cache.seek(data_offset)
+                cache.write(block.tobytes())
+                data_offset += -(-block.nbytes // BLOCK_ALIGNMENT) * BLOCK_ALIGNMENT
+        os.replace(tmp_path, path)
+    except OSError as error:
+        print('(W) Could not write mesh cache {}: {}'.format(path, error))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+
+    print('Saved mesh cache {}'.format(path))
+
+
+def load_mesh_cache(file_name):
+    """
+    Load the meshes of an obj file from its cache. Arrays are copy-on-write memory maps of the cache file.
+    :param file_name: path to the obj file
+    :return: list of meshes, or None if there is no valid cache
+    """
+    path = mesh_cache_path(file_name)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'rb') as cache:
+            if cache.read(len(MAGIC)) != MAGIC:
+                print('(W) {} is not a mesh cache, ignoring it.'.format(path))
+                return None
+            version, header_length = np.frombuffer(cache.read(8), dtype='<u4')
+            if version != MESH_CACHE_VERSION:
+                return None
+            header = json.loads(cache.read(int(header_length)).decode())
+    except (OSError, ValueError) as error:
+        print('(W) Could not read mesh cache {}: {}'.format(path, error))
+        return None
+
+    if any(source_changed(stamp) for stamp in header['sources']):
+        print('Mesh cache {} is out of date.'.format(path))
+        return None
+
+    data_offset = -(-(len(MAGIC) + 8 + int(header_length)) // BLOCK_ALIGNMENT) * BLOCK_ALIGNMENT
+    materials = [material_from_json(material) for material in header['materials']]
+
+    print('Loading mesh(es) from mesh cache: {}'.format(path))
+    meshes = []
+    for entry in header['meshes']:
+        arrays = {}
+        for name in BLOCK_DTYPES:
+            block = entry.get(name)
+            if block is None:
+                arrays[name] = None
+            elif np.prod(block['shape']) == 0:
+                # empty blocks cannot be memory mapped
+                arrays[name] = np.zeros(block['shape'], dtype=block['dtype'])
+            else:
+                arrays[name] = np.memmap(path, dtype=block['dtype'], mode='c', offset=data_offset + block['offset'],
+                                         shape=tuple(block['shape']))
+        meshes.append(Mesh(material=materials[entry['material']], **arrays))
+
+    return meshes
@@ -0,0 +1,62 @@
+import weakref
+
+
+class ResourceRegistry:
+    """
+    Registry of the live OpenGL objects of a scene and of their size, used to find objects that are never released
+    """
+    def __init__(self):
+        """
+        Initialise the registry
+        """
+        # (kind, handle) -> [weak reference to the owner, owner class name, size in bytes], owners are not kept
+        # alive by the registry so that they can still be released when garbage collected
+        self.resources = {}
+
+    def register(self, kind, handle, owner, nbytes=0):
+        """
+        Record a newly created OpenGL object
+        :param kind: type of object, EG. 'buffer' or 'vertex array'
+        :param handle: OpenGL name of the object
+        :param owner: object responsible for releasing it, EG. a model
+        :param nbytes: size of the data stored in the object
+        """
+        self.resources[(kind, int(handle))] = [weakref.ref(owner), owner.__class__.__name__, int(nbytes)]
+
+    def unregister(self, kind, handle):
+        """
+        Forget an OpenGL object once it has been deleted
+        :param kind: type of object
+        :param handle: OpenGL name of the object
+        """
+        self.resources.pop((kind, int(handle)), None)
+
+    def total_bytes(self):
+        """
+        :return: size of all live objects in bytes
+        """
+        return sum(nbytes for owner, name, nbytes in self.resources.values())
+
+    def leaks(self, live_owners):
+        """
+        Find the objects whose owner is no longer in use, or was garbage collected, but that have not been released
+        :param live_owners: list of the owners still in use, EG. the models of the scene
+        :return: list of (kind, handle, owner class name, size in bytes)
+        """
+        live = set(id(owner) for owner in live_owners)
+        return [(kind, handle, name, nbytes) for (kind, handle), (owner, name, nbytes) in self.resources.items()
+                if owner() is None or id(owner()) not in live]
+
+    def report(self, live_owners):
+        """
+        Print the live objects and the leaked ones
+        :param live_owners: list of the owners still in use
+        """
+        print('{} OpenGL objects alive, {:.1f} MiB'.format(len(self.resources), self.total_bytes() / 2 ** 20))
+
+        leaks = self.leaks(live_owners)
+        if len(leaks) > 0:
+            print('(W) {} OpenGL objects leaked, {:.1f} MiB:'.format(
+                len(leaks), sum(leak[3] for leak in leaks) / 2 ** 20))
+            for kind, handle, name, nbytes in leaks:
+                print('(W) - {} {} of {}, {} bytes'.format(kind, handle, name, nbytes))
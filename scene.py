@@ -1,9 +1,11 @@
 import pygame
 from OpenGL.GL import *
-from shaders import Shaders,Uniform
+from shaders import Shaders,Uniform,FurShader,UBOShader
 from camera import Camera
 from matutils import *
 from lightSource import LightSource
+from resources import ResourceRegistry
+from shadercache import ProgramCache
 
 
 class Scene:
@@ -37,14 +39,21 @@ class Scene:
         # enable depth test
         glEnable(GL_DEPTH_TEST)
 
+        # OpenGL objects created by the models, to find the ones never released
+        self.resources = ResourceRegistry()
+
         # dictionary of shaders used in this scene
         self.shaders_list = {
             'Gouraud': Shaders('gouraud'),
+            'Fur': FurShader(),
+            'GouraudUBO': UBOShader(),
         }
 
-        # compile shaders
+        # shaders are compiled on first use, and their linked programs cached on disk for the next runs
+        self.program_cache = ProgramCache()
         for shader in self.shaders_list.values():
-            shader.compile()
+            shader.cache = self.program_cache
+            shader.resources = self.resources
 
         self.shaders = self.shaders_list['Gouraud']
 
@@ -70,7 +79,29 @@ class Scene:
 
         self.models = []
 
+        # stacked model matrices, rebuilt when models are added or removed, and the matrices computed from them
+        # for the current camera
+        self.Mp = poseMatrix()
+        self.models_version = 0
+        self.model_matrices = stackMatrices([])
+        self.model_matrices_version = None
+        self.matrices = None
+        self.matrices_key = None
+
+        # skip the models outside of the view, bounds of all models are stacked with their matrices
+        self.frustum_culling = True
+        self.model_bounds = None
+        self.in_frustum = None
+        # models (drawn, culled) in the last frame
+        self.culling_stats = (0, 0)
+
+        # fur controlled by the keyboard, and all furs of the scene, which are grown between frames when streamed
         self.fur = None
+        self.furs = []
+
+        # number of the frame being drawn, and uniform uploads (issued, skipped) of the last frame
+        self.frame = 0
+        self.uniform_stats = (0, 0)
 
     def add_model(self, model):
         """
@@ -78,6 +109,7 @@ class Scene:
         :param model: model to add
         """
         self.models.append(model)
+        self.models_version += 1
 
     def add_models_list(self,models_list):
         """
@@ -85,13 +117,82 @@ class Scene:
         :param models_list: list of models to add
         """
         self.models.extend(models_list)
+        self.models_version += 1
 
     def remove_model(self, model):
         """
-        Remove model from model list
+        Remove model from model list, the model must be released by the caller when no longer used
         :param model: model to remove
         """
         self.models.remove(model)
+        self.models_version += 1
+
+    def update_matrices(self):
+        """
+        Compute the matrices of all models in one go, only when the models or the camera changed. A model whose
+        matrix M is replaced needs a call to invalidate_matrices().
+        :return: (M, PVM, VM, VMiT) arrays with one matrix per model
+        """
+        if self.model_matrices_version != self.models_version:
+            self.model_matrices = stackMatrices([model.M for model in self.models])
+            self.model_bounds = self.stack_bounds()
+            self.model_matrices_version = self.models_version
+
+        key = (self.models_version, self.camera.version)
+        if key != self.matrices_key:
+            self.matrices = (self.model_matrices,) + modelViewMatrices(self.P, self.camera.V, self.model_matrices)
+
+            # models without bounds are always drawn
+            box_min, box_max, centers, radii, bounded = self.model_bounds
+            self.in_frustum = ~bounded | boundsInFrustum(
+                frustumPlanes(np.matmul(self.P, self.camera.V)), self.model_matrices, box_min, box_max, centers, radii)
+            self.matrices_key = key
+
+        return self.matrices
+
+    def stack_bounds(self):
+        """
+        Stack the bounding volumes of all models, padded by how far their primitives reach beyond their vertices
+        :return: (box_min, box_max, centers, radii, bounded): (N,3), (N,3), (N,3), (N,) arrays and (N,) bool
+        array, False for the models without bounds
+        """
+        count = len(self.models)
+        box_min = np.zeros((count, 3), dtype=np.float32)
+        box_max = np.zeros((count, 3), dtype=np.float32)
+        centers = np.zeros((count, 3), dtype=np.float32)
+        radii = np.zeros(count, dtype=np.float32)
+        bounded = np.zeros(count, dtype=bool)
+
+        for index, model in enumerate(self.models):
+            if getattr(model, 'bounding_box', None) is None:
+                continue
+            padding = model.bounds_padding()
+            box_min[index] = model.bounding_box[0] - padding
+            box_max[index] = model.bounding_box[1] + padding
+            centers[index], radii[index] = model.bounding_sphere[0], model.bounding_sphere[1] + padding
+            bounded[index] = True
+
+        return box_min, box_max, centers, radii, bounded
+
+    def invalidate_matrices(self):
+        """
+        Recompute the model matrices and bounds at the next frame, EG. after moving a model or changing its
+        vertices
+        """
+        self.models_version += 1
+
+    def report_resources(self):
+        """
+        Print the OpenGL objects alive and those leaked by models removed from the scene without being released
+        """
+        self.resources.report(self.models + list(self.shaders_list.values()))
+
+    def release(self):
+        """
+        Delete the OpenGL objects of the shaders, the models are released by their owners
+        """
+        for shader in self.shaders_list.values():
+            shader.release()
 
     def draw(self):
         """
@@ -104,19 +205,33 @@ class Scene:
         # update the camera
         self.camera.update()
 
-        # iterate through models and draw them
-        for model in self.models:
-            model.draw(Mp=poseMatrix(), shaders=self.shaders)
+        # iterate through models and draw them, with matrices computed for all models at once
+        M, PVM, VM, VMiT = self.update_matrices()
+        if self.frustum_culling:
+            drawn = np.flatnonzero(self.in_frustum)
+        else:
+            drawn = range(len(self.models))
+        for index in drawn:
+            self.models[index].draw(Mp=self.Mp, shaders=self.shaders,
+                                    matrices=(M[index], PVM[index], VM[index], VMiT[index]))
+        self.culling_stats = (len(drawn), len(self.models) - len(drawn))
+
+        # count the uniform uploads of this frame
+        stats = [shader.upload_stats() for shader in self.shaders_list.values()]
+        self.uniform_stats = (sum(issued for issued, skipped in stats), sum(skipped for issued, skipped in stats))
+        self.frame += 1
 
         # flip buffers to display the frame
         pygame.display.flip()
 
     def set_fur(self, fur):
         """
-        Set the fur object
+        Set the fur object controlled by the keyboard, and add it to the furs of the scene
         :param fur: for object
         """
         self.fur = fur
+        if fur is not None and fur not in self.furs:
+            self.furs.append(fur)
 
     def keyboard(self, event):
         """
@@ -156,6 +271,14 @@ class Scene:
         elif event.key == pygame.K_v and self.fur is not None:
             # if V, reset fur
             self.fur.update_rot(False)
+        elif event.key == pygame.K_u:
+            # if U, print the uniform uploads of the last frame
+            print('Uniform uploads in last frame: {} issued, {} skipped'.format(*self.uniform_stats))
+        elif event.key == pygame.K_c:
+            # if C, toggle frustum culling and print the models culled in the last frame
+            print('Models in last frame: {} drawn, {} culled'.format(*self.culling_stats))
+            self.frustum_culling = not self.frustum_culling
+            print('Frustum culling {}.'.format('enabled' if self.frustum_culling else 'disabled'))
 
     def pygameEvents(self):
         """
@@ -204,4 +327,12 @@ class Scene:
         self.running = True
         while self.running:
             self.pygameEvents()
+
+            # grow some more of every fur being streamed
+            for fur in self.furs:
+                fur.stream_step()
+
             self.draw()
+
+        self.release()
+        self.report_resources()
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import numpy as np
+
+# version of the cache files, change it to invalidate old caches
+PROGRAM_CACHE_VERSION = 1
+
+
+class ProgramCache:
+    """
+    Persistent on-disk cache of linked GLSL program binaries. Binaries are only valid for the driver that produced
+    them, so the driver string is part of the key.
+    """
+    def __init__(self, directory='.shadercache'):
+        """
+        Initialise the cache
+        :param directory: folder where program binaries are stored
+        """
+        self.directory = directory
+
+    def key(self, sources, driver):
+        """
+        Compute the cache key of a program
+        :param sources: list of the GLSL sources of the program, and of anything else changing the linked program
+        :param driver: string identifying the OpenGL driver, EG. vendor, renderer and version
+        :return: hex digest key
+        """
+        digest = hashlib.sha1(str(PROGRAM_CACHE_VERSION).encode())
+        for source in list(sources) + [driver]:
+            source = source.encode()
+            # prefix each part with its length so that parts cannot run into each other
+            digest.update('{}:'.format(len(source)).encode())
+            digest.update(source)
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Load a cached program binary
+        :param key: cache key
+        :return: (binary format, uint8 array of the binary), or None if the program is not cached
+        """
+        path = os.path.join(self.directory, key + '.bin')
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with open(path, 'rb') as cache:
+                binary_format = int(np.frombuffer(cache.read(4), dtype='<u4')[0])
+                binary = np.frombuffer(cache.read(), dtype=np.uint8)
+        except (OSError, ValueError, IndexError) as error:
+            print('(W) Could not read cached program {}: {}'.format(key, error))
+            return None
+
+        return binary_format, binary
+
+    def save(self, key, binary_format, binary):
+        """
+        Store a program binary in the cache
+        :param key: cache key
+        :param binary_format: OpenGL format of the binary
+        :param binary: uint8 array of the binary
+        """
+        path = os.path.join(self.directory, key + '.bin')
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as cache:
+                cache.write(np.array([binary_format], dtype='<u4').tobytes())
+                cache.write(np.ascontiguousarray(binary, dtype=np.uint8).tobytes())
+            os.replace(tmp_path, path)
+        except OSError as error:
+            print('(W) Could not write cached program {}: {}'.format(key, error))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def remove(self, key):
+        """
+        Remove a program from the cache, EG. when the driver rejects its binary
+        :param key: cache key
+        """
+        path = os.path.join(self.directory, key + '.bin')
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,8 +1,42 @@
+import weakref
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GL import shaders
+from OpenGL.error import GLError, NullFunctionError
 from matutils import *
 import numpy as np
+from bufferutils import std140_layout, std140_pack, FRAME_BLOCK, MATERIAL_BLOCK
+
+# locations of the vertex attributes, bound in all GLSL programs before they are linked so that a VAO can be
+# set up without knowing the program it will be drawn with
+ATTRIBUTE_LOCATIONS = {
+    'position': 0,
+    'normal': 1,
+    'color': 2,
+    'hair_scale': 3,
+}
+
+
+def program_binary_supported():
+    """
+    :return: True if the driver can save and load linked program binaries
+    """
+    try:
+        return bool(glProgramBinary) and bool(glGetProgramBinary) and \
+            glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+    except (GLError, NullFunctionError):
+        return False
+
+
+def driver_string():
+    """
+    :return: vendor, renderer and version of the OpenGL driver, program binaries are only valid for the same string
+    """
+    names = []
+    for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+        value = glGetString(name)
+        names.append(value.decode(errors='replace') if value is not None else '')
+    return ' / '.join(names)
 
 
 class Uniform:
@@ -19,6 +53,11 @@ class Uniform:
         self.value = value
         self.location = -1
 
+        # last value uploaded to the program, uploads of the same value are skipped
+        self.uploaded = None
+        self.issued = 0
+        self.skipped = 0
+
     def link(self, program):
         """
         This function needs to be called after compiling the GLSL program to fetch the location of the uniform
@@ -29,6 +68,9 @@ class Uniform:
         if self.location == -1:
             print('(E) Warning, no uniform {}'.format(self.name))
 
+        # a newly linked program has none of our values
+        self.uploaded = None
+
     def bind_matrix(self, M=None, number=1, transpose=True):
         """
         Call this before rendering to bind the Python matrix to the GLSL uniform mat4.
@@ -57,6 +99,14 @@ class Uniform:
         if self.value is None:
             print('(E) Error in Uniform.bind(): Invalid value: None')
 
+        # the program keeps uniform values between draws, so only upload values that changed
+        if self.uploaded is not None and type(self.uploaded) is type(self.value) \
+                and np.array_equal(self.uploaded, self.value):
+            self.skipped += 1
+            return
+        self.uploaded = self.value.copy() if isinstance(self.value, np.ndarray) else self.value
+        self.issued += 1
+
         if isinstance(self.value, int):
             self.bind_int()
 
@@ -154,6 +204,19 @@ class Shaders:
             'Is': Uniform('Is'),
         }
 
+        # values of the current frame and material, to only recompute them when they change
+        self.frame = None
+        self.PV = None
+        self.V = None
+        self.material = None
+
+        # the program is compiled on first use, see use()
+        self.program = None
+        # ProgramCache where the linked program binary is stored, None to always compile the GLSL code
+        self.cache = None
+        # ResourceRegistry where the OpenGL objects created by the shader are recorded, EG. uniform buffers
+        self.resources = None
+
         self.name = name
         if name is not None:
             vertex_shader = 'shaders/{}/vertex_shader.glsl'.format(name)
@@ -194,7 +257,6 @@ class Shaders:
             print('Load vertex shader from file: {}'.format(vertex_shader))
             with open(vertex_shader, 'r') as file:
                 self.vertex_shader_source = file.read()
-            print(self.vertex_shader_source)
 
             # load the fragment shader GLSL code
             if fragment_shader is None:
@@ -212,7 +274,6 @@ class Shaders:
                 print('Load fragment shader from file: {}'.format(fragment_shader))
                 with open(fragment_shader, 'r') as file:
                     self.fragment_shader_source = file.read()
-                print(self.fragment_shader_source)
 
     def add_uniform(self, name):
         """
@@ -223,7 +284,34 @@ class Shaders:
 
     def compile(self):
         """
-        Compile the GLSL codes for both shaders.
+        Compile the GLSL codes for both shaders, or load the linked program from the cache if it was compiled
+        before with the same codes and driver.
+        """
+        key = None
+        if self.cache is not None and program_binary_supported():
+            key = self.cache.key([self.vertex_shader_source, self.fragment_shader_source,
+                                  repr(sorted(ATTRIBUTE_LOCATIONS.items()))], driver_string())
+
+        if key is None or not self.load_binary(key):
+            self.compile_source(retrievable=key is not None)
+            if key is not None:
+                self.save_binary(key)
+
+        # tell OpenGL to use this shader program for rendering
+        glUseProgram(self.program)
+
+        # link all uniforms
+        for uniform in self.uniforms:
+            self.uniforms[uniform].link(self.program)
+
+        # the uniforms of the frame and material need to be set in the new program
+        self.frame = None
+        self.material = None
+
+    def compile_source(self, retrievable=False):
+        """
+        Compile and link the GLSL codes
+        :param retrievable: True to allow getting the binary of the linked program
         """
         print('Compiling GLSL shaders...')
         try:
@@ -235,43 +323,151 @@ class Shaders:
             print('(E) An error occurred while compiling {} shader:\n {}\n... forwarding exception...'.format(self.name, error)),
             raise error
 
-        # tell OpenGL to use this shader program for rendering
-        glUseProgram(self.program)
+        if retrievable:
+            glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
 
-        # link all uniforms
-        for uniform in self.uniforms:
-            self.uniforms[uniform].link(self.program)
+        # attribute locations only take effect when the program is linked, so link it again
+        for name, location in ATTRIBUTE_LOCATIONS.items():
+            glBindAttribLocation(self.program, location, name)
+        glLinkProgram(self.program)
+        if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+            raise RuntimeError('(E) Error linking {} shader: {}'.format(self.name, glGetProgramInfoLog(self.program)))
+
+    def load_binary(self, key):
+        """
+        Load the linked program from the cache
+        :param key: cache key of the program
+        :return: True if the program was loaded, False if it needs to be compiled
+        """
+        cached = self.cache.load(key)
+        if cached is None:
+            return False
+        binary_format, binary = cached
+
+        program = glCreateProgram()
+        try:
+            glProgramBinary(program, binary_format, binary, binary.shape[0])
+            linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+        except GLError:
+            linked = False
+
+        if not linked:
+            # EG. the driver was updated without changing its version string
+            print('(W) Cached binary of {} shader rejected by the driver, compiling it.'.format(self.name))
+            glDeleteProgram(program)
+            self.cache.remove(key)
+            return False
+
+        print('Loaded {} shader from program cache'.format(self.name))
+        self.program = program
+        return True
+
+    def save_binary(self, key):
+        """
+        Store the linked program in the cache
+        :param key: cache key of the program
+        """
+        try:
+            length = glGetProgramiv(self.program, GL_PROGRAM_BINARY_LENGTH)
+            if length <= 0:
+                return
+            binary = np.zeros(length, dtype=np.uint8)
+            written = np.zeros(1, dtype=np.int32)
+            binary_format = np.zeros(1, dtype=np.uint32)
+            glGetProgramBinary(self.program, length, written, binary_format, binary)
+        except GLError as error:
+            print('(W) Could not get binary of {} shader: {}'.format(self.name, error))
+            return
+
+        self.cache.save(key, int(binary_format[0]), binary[:written[0]])
+
+    def use(self):
+        """
+        Tell OpenGL to use this shader program for rendering, compiling it on first use
+        """
+        if self.program is None:
+            self.compile()
+        glUseProgram(self.program)
 
     def bind(self, P, V, M, mode, light, material):
         """
         Enable this GLSL program
         """
+        self.bind_frame(P, V, mode, light)
+        self.bind_model(M, material)
 
-        # tell OpenGL to use this shader program for rendering
-        glUseProgram(self.program)
+    def bind_frame(self, P, V, mode, light, frame=None):
+        """
+        Enable this GLSL program and set the uniforms shared by all models of a frame
+        :param P: projection matrix
+        :param V: view matrix
+        :param mode: rendering mode
+        :param light: light source
+        :param frame: number of the frame, the uniforms are only set for the first model of each frame
+        """
 
-        # set the PVM matrix uniform
-        self.uniforms['PVM'].set(np.matmul(P,np.matmul(V,M)))
+        # tell OpenGL to use this shader program for rendering, compiling it on first use
+        self.use()
 
-        # set the VM matrix uniform
-        self.uniforms['VM'].set(np.matmul(V,M))
+        if frame is not None and frame == self.frame:
+            return
+        self.frame = frame
 
-        # set the VMiT matrix uniform
-        self.uniforms['VMiT'].set(np.linalg.inv(np.matmul(V,M))[:3,:3].transpose())
+        self.V = np.asarray(V, dtype=np.float32)
+        self.PV = np.matmul(np.asarray(P, dtype=np.float32), self.V)
 
         # set the mode to the program
         self.uniforms['mode'].set(mode)
 
-        # set material properties
-        self.set_material_uniforms(material)
-
         # set the light properties
-        self.set_light_uniforms(light,V)
+        self.set_light_uniforms(light, V)
+
+    def bind_model(self, M, material, matrices=None):
+        """
+        Set the uniforms of a model and upload the uniforms that changed, after bind_frame()
+        :param M: model matrix
+        :param material: model material
+        :param matrices: (PVM, VM, VMiT) precomputed for this frame, EG. by Scene.update_matrices(), None to
+        compute them from M
+        """
+        if matrices is None:
+            VM = np.matmul(self.V, M)
+            # only the rotation part is needed for normals
+            matrices = (np.matmul(self.PV, M), VM, np.linalg.inv(VM[:3, :3]).transpose())
+        PVM, VM, VMiT = matrices
+
+        # set the PVM matrix uniform
+        self.uniforms['PVM'].set(PVM)
+
+        # set the VM matrix uniform
+        self.uniforms['VM'].set(VM)
+
+        # set the VMiT matrix uniform
+        self.uniforms['VMiT'].set(VMiT)
+
+        # set material properties, only when the material changes
+        if material is not self.material:
+            self.set_material_uniforms(material)
+            self.material = material
 
         # bind everything
         for uniform in self.uniforms.values():
             uniform.bind()
 
+    def upload_stats(self, reset=True):
+        """
+        Count the uniform uploads issued and skipped because the value had not changed
+        :param reset: bool, reset the counts
+        :return: (issued, skipped)
+        """
+        issued = sum(uniform.issued for uniform in self.uniforms.values())
+        skipped = sum(uniform.skipped for uniform in self.uniforms.values())
+        if reset:
+            for uniform in self.uniforms.values():
+                uniform.issued = 0
+                uniform.skipped = 0
+        return issued, skipped
+
     def set_light_uniforms(self, light, V):
         """
         Set light uniforms for shader
@@ -296,6 +492,14 @@ class Shaders:
     def set_mode(self, mode):
         self.uniforms['mode'].set(mode)
 
+    def release(self):
+        """
+        Delete the GLSL program, it is compiled again if the shader is used after
+        """
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
+
 
 class GouraudShader(Shaders):
     """
@@ -303,4 +507,193 @@ class GouraudShader(Shaders):
     :param Shaders: shaders list
     """
     def __init__(self):
-        Shaders.__init__(self, name='gouraud')
\ No newline at end of file
+        Shaders.__init__(self, name='gouraud')
+
+class FurShader(Shaders):
+    """
+    Fur shader extends shader, extrudes hair lines from their roots
+    :param Shaders: shaders list
+    """
+    def __init__(self):
+        Shaders.__init__(self, name='fur')
+
+        # fur uniforms, updated by FurModel before every draw
+        self.uniforms['fur_length'] = Uniform('fur_length', 0.1)
+        self.uniforms['random_angle'] = Uniform('random_angle', 0)
+        self.uniforms['fur_direction'] = Uniform('fur_direction', np.array([0., 0., 1.], 'f'))
+
+
+# binding points of the uniform blocks of the UBO shaders, see bufferutils for their members
+FRAME_BLOCK_BINDING = 0
+MATERIAL_BLOCK_BINDING = 1
+
+
+class UniformBuffer:
+    """
+    Uniform buffer object holding one std140 uniform block
+    """
+    def __init__(self, fields, binding, resources=None, owner=None):
+        """
+        Create the buffer
+        :param fields: list of (name, GLSL type) of the block members
+        :param binding: binding point the buffer is bound to
+        :param resources: ResourceRegistry where the buffer is recorded, or None
+        :param owner: object responsible for releasing the buffer, EG. the shader using it
+        """
+        self.fields = fields
+        self.binding = binding
+        self.size = std140_layout(fields)[1]
+        self.resources = resources
+
+        self.buffer = glGenBuffers(1)
+        if self.resources is not None:
+            self.resources.register('uniform buffer', self.buffer, owner, self.size)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.size, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def update(self, values):
+        """
+        Upload new values of the block
+        :param values: dictionary of member name to value
+        """
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.size, std140_pack(self.fields, values))
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def bind(self):
+        """
+        Bind the buffer to its binding point, making it the block used by the following draws
+        """
+        glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, self.buffer)
+
+    def release(self):
+        """
+        Delete the buffer
+        """
+        glDeleteBuffers(1, [self.buffer])
+        if self.resources is not None:
+            self.resources.unregister('uniform buffer', self.buffer)
+
+
+class UBOShader(Shaders):
+    """
+    Gouraud shader reading the frame and material uniforms from uniform buffer objects, so that only the model
+    and normal matrices are uploaded for each draw
+    :param Shaders: shaders list
+    """
+    def __init__(self):
+        Shaders.__init__(self, name='gouraud_ubo')
+
+        # everything else is in the uniform blocks
+        self.uniforms = {
+            'M': Uniform('M'),
+            'VMiT': Uniform('VMiT'),  # normal matrix, inverting it in the shader would be done for every vertex
+            'mode': Uniform('mode', 0),
+        }
+
+        # the frame block is created with the first frame, as it needs an OpenGL context
+        self.frame_buffer = None
+        # id(material) -> (weak reference to the material, UniformBuffer), buffers of the materials no longer used
+        # are released once per frame
+        self.material_buffers = {}
+
+    def compile(self):
+        """
+        Compile the GLSL codes and bind the uniform blocks to their binding points
+        """
+        Shaders.compile(self)
+
+        for block, binding in (('FrameData', FRAME_BLOCK_BINDING), ('MaterialData', MATERIAL_BLOCK_BINDING)):
+            index = glGetUniformBlockIndex(self.program, block)
+            if index == GL_INVALID_INDEX:
+                print('(E) Warning, no uniform block {}'.format(block))
+            else:
+                glUniformBlockBinding(self.program, index, binding)
+
+    def bind_frame(self, P, V, mode, light, frame=None):
+        """
+        Enable this GLSL program and upload the frame block, once per frame
+        :param P: projection matrix
+        :param V: view matrix
+        :param mode: rendering mode
+        :param light: light source
+        :param frame: number of the frame, the block is only uploaded for the first model of each frame
+        """
+        self.use()
+
+        if frame is not None and frame == self.frame:
+            return
+        self.frame = frame
+        # kept to compute the normal matrix of models drawn without precomputed matrices
+        self.V = np.asarray(V, dtype=np.float32)
+
+        self.release_material_buffers(unused_only=True)
+
+        if self.frame_buffer is None:
+            self.frame_buffer = UniformBuffer(FRAME_BLOCK, FRAME_BLOCK_BINDING, self.resources, self)
+
+        self.frame_buffer.update({
+            'P': P,
+            'V': V,
+            'light': unhomog(np.dot(V, homog(light.position))),
+            'Ia': light.Ia,
+            'Id': light.Id,
+            'Is': light.Is,
+        })
+        self.frame_buffer.bind()
+
+        self.uniforms['mode'].set(mode)
+
+    def bind_model(self, M, material, matrices=None):
+        """
+        Set the model matrix, bind the material block and upload the uniforms that changed
+        :param M: model matrix
+        :param material: model material, its block is uploaded the first time it is used
+        :param matrices: (PVM, VM, VMiT) precomputed for this frame, EG. by Scene.update_matrices(), only VMiT is
+        used as the shader computes the others from M. None to compute VMiT from M.
+        """
+        self.uniforms['M'].set(M)
+
+        if matrices is None:
+            VMiT = np.linalg.inv(np.matmul(self.V, M)[:3, :3]).transpose()
+        else:
+            VMiT = matrices[2]
+        self.uniforms['VMiT'].set(VMiT)
+
+        if material is not self.material:
+            entry = self.material_buffers.get(id(material))
+            if entry is None or entry[0]() is not material:
+                if entry is not None:
+                    # the id belonged to a material that no longer exists
+                    entry[1].release()
+                buffer = UniformBuffer(MATERIAL_BLOCK, MATERIAL_BLOCK_BINDING, self.resources, self)
+                buffer.update({'Ka': material.Ka, 'Kd': material.Kd, 'Ks': material.Ks, 'Ns': material.Ns})
+                entry = (weakref.ref(material), buffer)
+                self.material_buffers[id(material)] = entry
+            entry[1].bind()
+            self.material = material
+
+        for uniform in self.uniforms.values():
+            uniform.bind()
+
+    def release_material_buffers(self, unused_only=False):
+        """
+        Delete the material blocks
+        :param unused_only: bool, only delete the blocks of the materials that no longer exist
+        """
+        for key, (material, buffer) in list(self.material_buffers.items()):
+            if not unused_only or material() is None:
+                buffer.release()
+                del self.material_buffers[key]
+
+    def release(self):
+        """
+        Delete the uniform buffers and the GLSL program
+        """
+        self.release_material_buffers()
+        if self.frame_buffer is not None:
+            self.frame_buffer.release()
+            self.frame_buffer = None
+        self.material = None
+        Shaders.release(self)
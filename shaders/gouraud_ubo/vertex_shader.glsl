@@ -0,0 +1,58 @@
+#version 140		// required for uniform blocks
+
+//=== in attributes are read from the vertex array, one row per instance of the shader
+in vec3 position;	// the position attribute contains the vertex position
+in vec3 normal;		// store the vertex normal
+in vec3 color; 		// store the vertex colour
+
+//=== out attributes are interpolated on the face, and passed on to the fragment shader
+out vec3 fragment_color;  // the output of the shader will be the colour of the vertex
+
+//=== uniform blocks, shared by all draws and uploaded once per frame or once per material
+layout(std140) uniform FrameData {
+    mat4 P;         // projection matrix
+    mat4 V;         // view matrix
+    vec3 light;     // light position in view space
+    vec3 Ia;        // ambient light properties
+    vec3 Id;        // diffuse properties of the light source
+    vec3 Is;        // specular properties of the light source
+};
+
+layout(std140) uniform MaterialData {
+    vec3 Ka;        // ambient reflection properties of the material
+    vec3 Kd;        // diffuse reflection propoerties of the material
+    vec3 Ks;        // specular properties of the material
+    float Ns;       // specular exponent
+};
+
+//=== uniforms set for each draw
+uniform mat4 M; 	// the Model matrix
+uniform mat3 VMiT;  // the inverse-transpose of the view model matrix, computed on the CPU for all models at once
+uniform int mode;	// the rendering mode (better to code different shaders!)
+
+
+void main() {
+    // 1. the model matrices are combined here rather than for each draw on the CPU, except for the normal matrix
+    // which would need an inverse for every vertex
+    mat4 VM = V*M;
+    gl_Position = P * VM * vec4(position, 1.0f);
+
+    // 2. calculate vectors used for shading calculations
+    vec3 position_view_space = vec3(VM*vec4(position,1.0f));
+    vec3 normal_view_space = normalize(VMiT*normal);
+    vec3 camera_direction = -normalize(position_view_space);
+    vec3 light_direction = normalize(light-position_view_space);
+
+    // 3. now we calculate light components
+    vec3 ambient = Ia*Ka;
+    vec3 diffuse = Id*Kd*max(0.0f,dot(light_direction, normal_view_space));
+    vec3 specular = Is*Ks*pow(max(0.0f, dot(reflect(light_direction, normal_view_space), -camera_direction)), Ns);
+
+    // 4. we calculate the attenuation function
+    // in this formula, dist should be the distance between the surface and the light
+    float dist = length(light - position_view_space);
+    float attenuation =  min(1.0/(dist*dist*0.005) + 1.0/(dist*0.05), 1.0);
+
+    // 5. Finally, we combine the shading components
+    fragment_color = ambient + attenuation*(diffuse + specular);
+}
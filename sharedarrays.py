@@ -0,0 +1,56 @@
+"""
+NumPy arrays in shared memory, used to pass large arrays to and from worker processes without pickling them
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedArrays:
+    """
+    Set of named NumPy arrays stored in shared memory
+    """
+    def __init__(self, specs=None):
+        """
+        Create the shared arrays
+        :param specs: dictionary of name to (shape, dtype)
+        """
+        self.blocks = {}
+        self.arrays = {}
+        self.specs = {}
+
+        for name, (shape, dtype) in (specs or {}).items():
+            dtype = np.dtype(dtype)
+            size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            self.specs[name] = (block.name, shape, dtype.str)
+
+    @classmethod
+    def attach(cls, specs):
+        """
+        Attach to shared arrays created by another process
+        :param specs: SharedArrays.specs of the arrays to attach to
+        :return: SharedArrays
+        """
+        shared = cls()
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            shared.blocks[name] = block
+            shared.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            shared.specs[name] = (block_name, shape, dtype)
+        return shared
+
+    def close(self, unlink=False):
+        """
+        Detach from the shared memory
+        :param unlink: bool, also free the memory (only in the process that created it)
+        """
+        # views must be released before the memory can be closed
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+        self.blocks = {}
@@ -0,0 +1,121 @@
+"""
+CPU side tests of the data packed into OpenGL buffers, run with pytest
+"""
+
+import numpy as np
+import pytest
+from bufferutils import interleave_attributes, std140_layout, std140_pack, FRAME_BLOCK, MATERIAL_BLOCK
+from furutils import hair_root_buffers, calculate_hair_end_points
+
+
+def test_frame_block_layout():
+    offsets, size = std140_layout(FRAME_BLOCK)
+    assert offsets == {'P': 0, 'V': 64, 'light': 128, 'Ia': 144, 'Id': 160, 'Is': 176}
+    assert size == 192
+
+
+def test_material_block_layout():
+    offsets, size = std140_layout(MATERIAL_BLOCK)
+    assert offsets == {'Ka': 0, 'Kd': 16, 'Ks': 32, 'Ns': 44}
+    assert size == 48
+
+
+def test_material_block_pack():
+    data = std140_pack(MATERIAL_BLOCK, {'Ka': [1, 2, 3], 'Kd': [4, 5, 6], 'Ks': [7, 8, 9], 'Ns': 10})
+    floats = data.view(np.float32)
+    assert data.shape == (48,)
+    # Ns fills the padding after Ks
+    assert floats.tolist() == [1, 2, 3, 0, 4, 5, 6, 0, 7, 8, 9, 10]
+
+
+def test_matrices_packed_by_column():
+    M = np.arange(16, dtype=np.float32).reshape(4, 4)
+    data = std140_pack([('M', 'mat4')], {'M': M})
+    assert np.array_equal(data.view(np.float32).reshape(4, 4), M.T)
+
+
+def test_mat3_columns_padded():
+    M = np.arange(1, 10, dtype=np.float32).reshape(3, 3)
+    offsets, size = std140_layout([('M', 'mat3'), ('x', 'float')])
+    assert offsets == {'M': 0, 'x': 48}
+    assert size == 64
+
+    data = std140_pack([('M', 'mat3'), ('x', 'float')], {'M': M, 'x': 5.})
+    columns = data.view(np.float32)[:12].reshape(3, 4)
+    assert np.array_equal(columns[:, :3], M.T)
+    assert np.array_equal(columns[:, 3], np.zeros(3))
+    assert data.view(np.float32)[12] == 5.
+
+
+def test_int_packed_as_int32():
+    data = std140_pack([('x', 'float'), ('mode', 'int')], {'x': 1., 'mode': 3})
+    assert data.view(np.int32)[1] == 3
+
+
+def test_interleave_attributes():
+    positions = np.arange(9, dtype=np.float32).reshape(3, 3)
+    normals = -np.arange(9, dtype=np.float32).reshape(3, 3)
+    scales = np.array([1, 2, 3], dtype=np.uint8)
+
+    buffer, layout, stride = interleave_attributes({'position': positions, 'normal': normals, 'color': None,
+                                                    'hair_scale': scales})
+    assert buffer.shape == (3, 7)
+    assert buffer.dtype == np.float32
+    assert layout == {'position': (3, 0), 'normal': (3, 12), 'hair_scale': (1, 24)}
+    assert stride == 28
+    assert np.array_equal(buffer[:, :3], positions)
+    assert np.array_equal(buffer[:, 3:6], normals)
+    assert np.array_equal(buffer[:, 6], scales)
+
+
+def test_interleave_attributes_vertex_count_mismatch():
+    with pytest.raises(ValueError):
+        interleave_attributes({'position': np.zeros((3, 3)), 'normal': np.zeros((2, 3))})
+
+
+def test_interleave_attributes_empty():
+    buffer, layout, stride = interleave_attributes({'position': None})
+    assert buffer.shape == (0, 0)
+    assert layout == {}
+    assert stride == 0
+
+
+def test_hair_root_buffers():
+    vertices = np.random.rand(5, 3)
+    normals = np.random.rand(5, 3).astype(np.float16)
+    scales = np.arange(5)
+
+    buffers = hair_root_buffers(vertices, normals, scales)
+    assert buffers['position'].dtype == np.float32
+    assert buffers['normal'].dtype == np.float16
+    assert buffers['hair_scale'].dtype == np.uint8
+    assert all(buffer.flags['C_CONTIGUOUS'] for buffer in buffers.values())
+    assert np.array_equal(buffers['hair_scale'], scales)
+
+    assert hair_root_buffers(vertices, normals.astype(np.float64), scales)['normal'].dtype == np.float32
+
+
+def test_calculate_hair_end_points():
+    vertices = np.random.rand(6, 3).astype(np.float32)
+    normals = np.random.rand(6, 3).astype(np.float32)
+    scales = np.arange(6, dtype=np.uint8)
+
+    ends = calculate_hair_end_points(vertices, normals, scales, 0.5, seed=1)
+    # same formula as the fur vertex shader: position + normal * fur_length * hair_scale * 0.1
+    assert np.allclose(ends, vertices + normals * 0.5 * scales[:, None] * 0.1)
+
+    out = np.empty((6, 3), dtype=np.float32)
+    assert calculate_hair_end_points(vertices, normals, scales, 0.5, seed=1, out=out) is out
+    assert np.array_equal(out, ends)
+
+
+def test_calculate_hair_end_points_random_angle():
+    vertices = np.random.rand(6, 3).astype(np.float32)
+    normals = np.random.rand(6, 3).astype(np.float32)
+    scales = np.full(6, 10, dtype=np.uint8)
+
+    ends = calculate_hair_end_points(vertices, normals, scales, 1., seed=1, random_angle=True)
+    directions = ends - vertices
+    # every hair points along the same normal, picked by the seed
+    assert np.allclose(directions, directions[0])
+    assert any(np.allclose(directions[0], normal) for normal in normals)
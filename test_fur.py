@@ -0,0 +1,140 @@
+"""
+CPU side tests of the fur generation, run with pytest. The fur is grown without creating its OpenGL models.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('OpenGL')
+
+from fur import Fur
+from furparallel import grow_hair_parallel
+from furutils import calculate_hair_ends
+
+SEED = 5
+LENGTH = 0.1
+
+
+def grid_mesh(n, quads):
+    """
+    Small bumpy n x n grid
+    :param n: number of cells along each side
+    :param quads: bool, one quad per cell rather than two triangles
+    :return: vertices, normals, faces
+    """
+    x, z = np.meshgrid(np.arange(n + 1, dtype='f'), np.arange(n + 1, dtype='f'))
+    vertices = np.stack([x.ravel(), np.sin(x.ravel()) * np.cos(z.ravel()), z.ravel()], axis=1).astype('f')
+    normals = np.random.default_rng(0).normal(size=vertices.shape).astype('f') + np.array([0, 2, 0], 'f')
+
+    corner = (np.arange(n)[:, None] * (n + 1) + np.arange(n)[None, :]).ravel()
+    if quads:
+        faces = np.stack([corner, corner + n + 1, corner + n + 2, corner + 1], axis=1)
+    else:
+        faces = np.concatenate([np.stack([corner, corner + n + 1, corner + n + 2], axis=1),
+                                np.stack([corner, corner + n + 2, corner + 1], axis=1)])
+    return vertices, normals, faces.astype(np.uint32)
+
+
+@pytest.fixture(params=['triangles', 'quads'])
+def mesh(request):
+    return grid_mesh(4, request.param == 'quads')
+
+
+@pytest.fixture
+def make_fur(monkeypatch):
+    # no hair model, so no OpenGL context is needed
+    monkeypatch.setattr(Fur, 'create_hair', lambda self: None)
+
+    def make(mesh, iterations, half_normals=False, **kwargs):
+        vertices, normals, faces = mesh
+        return Fur(None, vertices, normals, faces, iterations=iterations, length=LENGTH, seed=SEED,
+                   half_normals=half_normals, **kwargs)
+
+    return make
+
+
+@pytest.mark.parametrize('half_normals', [False, True])
+def test_parallel_matches_single_process(mesh, make_fur, half_normals):
+    fur = make_fur(mesh, 3, half_normals)
+    fur.grow_hair(3)
+    ends = calculate_hair_ends(fur.grown_vertices, fur.grown_normals, fur.grown_scales, LENGTH, SEED)
+
+    vertices, normals, faces = mesh
+    hair_vertices, hair_normals, hair_scales, hair_combined = grow_hair_parallel(
+        vertices, normals, faces, 3, SEED, LENGTH, workers=2, normal_dtype=fur.normal_dtype)
+
+    assert hair_normals.dtype == fur.grown_normals.dtype
+    assert hair_vertices.tobytes() == fur.grown_vertices.tobytes()
+    assert hair_normals.tobytes() == fur.grown_normals.tobytes()
+    assert hair_scales.tobytes() == fur.grown_scales.tobytes()
+    assert hair_combined.tobytes() == ends.tobytes()
+
+
+def test_incremental_growth_matches_full_growth(mesh, make_fur):
+    full = make_fur(mesh, 3)
+    full.grow_hair(3)
+
+    fur = make_fur(mesh, 3)
+    fur.grow_hair(1)
+    low_count = fur.level_counts[1]
+    low_vertices = fur.grown_vertices.copy()
+    fur.grow_hair(3)
+
+    # every density is a prefix of the higher ones
+    assert np.array_equal(full.grown_vertices[:low_count], low_vertices)
+    assert fur.level_counts == full.level_counts
+    assert np.array_equal(fur.grown_vertices, full.grown_vertices)
+    assert np.array_equal(fur.grown_normals, full.grown_normals)
+    assert np.array_equal(fur.grown_scales, full.grown_scales)
+
+
+def stream(fur):
+    """
+    Run all the batches of a streamed fur, checking that the hairs written so far are always a prefix
+    :param fur: Fur with its stream prepared
+    :return: list of the (first, last) hairs of every batch
+    """
+    batches = []
+    for first, last in fur.batches:
+        assert first == (batches[-1][1] if batches else 0)
+        batches.append((first, last))
+    fur.batches = None
+    return batches
+
+
+def test_streamed_fur_matches_grown_fur(mesh, make_fur):
+    full = make_fur(mesh, 3)
+    full.grow_hair(3)
+    ends = calculate_hair_ends(full.grown_vertices, full.grown_normals, full.grown_scales, LENGTH, SEED)
+
+    fur = make_fur(mesh, 3, streaming=True, frame_hairs=7)
+    fur.prepare_stream()
+    batches = stream(fur)
+
+    assert batches[0] == (0, mesh[0].shape[0])
+    assert batches[-1][1] == full.grown_vertices.shape[0]
+    assert np.array_equal(fur.grown_vertices, full.grown_vertices)
+    assert np.array_equal(fur.grown_normals, full.grown_normals)
+    assert np.array_equal(fur.grown_scales, full.grown_scales)
+    assert np.array_equal(fur.hair_combined, ends)
+
+
+def test_streamed_fur_continues_from_lower_density(mesh, make_fur):
+    full = make_fur(mesh, 3)
+    full.grow_hair(3)
+
+    fur = make_fur(mesh, 2, streaming=True, frame_hairs=7)
+    fur.prepare_stream()
+    stream(fur)
+    low_count = fur.level_counts[2]
+
+    fur.iterations = 3
+    fur.prepare_stream()
+    batches = stream(fur)
+
+    # the hairs grown before are uploaded in one batch, then only the new level is grown
+    assert batches[0] == (0, low_count)
+    assert all(first >= low_count for first, last in batches[1:])
+    assert np.array_equal(fur.grown_vertices, full.grown_vertices)
+    assert np.array_equal(fur.grown_normals, full.grown_normals)
+    assert np.array_equal(fur.grown_scales, full.grown_scales)